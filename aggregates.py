@@ -0,0 +1,105 @@
+import threading
+
+# Estatísticas materializadas do banco: contadores por grupo, mantidos a cada lançamento
+# pelas variações (deltas) que ele provoca, sem percorrer os atendimentos
+GRUPOS = ("total", "status", "consultor", "etapa", "mes", "atendimentos_proposta", "horas_proposta")
+
+def _chave(valor):
+    return "" if valor is None else str(valor)
+
+def _horas(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return 0
+
+# Contribuição de um registro para os contadores: [(grupo, chave, valor)]
+def contribution(colecao, registro):
+    itens = [("total", colecao, 1)]
+    if colecao == "atendimentos":
+        itens += [
+            ("status", _chave(registro.get("idChecagem")), 1),
+            ("consultor", _chave(registro.get("idConsultor")), 1),
+            ("etapa", _chave(registro.get("idEtapa")), 1),
+            ("mes", _chave(registro.get("idData"))[:7], 1),
+            ("atendimentos_proposta", _chave(registro.get("idNumPropostas")), 1)
+        ]
+    elif colecao == "propostas":
+        itens.append(("horas_proposta", _chave(registro.get("idNumPropostas")), _horas(registro.get("idHorasContratadas"))))
+    return itens
+
+# Variações provocadas por um lançamento (anterior é o registro substituído numa alteração ou o excluído)
+def deltas(entrada, anterior=None):
+    variacao = {}
+    if entrada["op"] != "delete":
+        for grupo, chave, valor in contribution(entrada["colecao"], entrada["registro"]):
+            variacao[grupo, chave] = variacao.get((grupo, chave), 0) + valor
+    if anterior is not None:
+        for grupo, chave, valor in contribution(entrada["colecao"], anterior):
+            variacao[grupo, chave] = variacao.get((grupo, chave), 0) - valor
+    return [(grupo, chave, valor) for (grupo, chave), valor in variacao.items() if valor]
+
+class Aggregates:
+    def __init__(self, db=None, estado=None):
+        self._lock = threading.Lock()
+        self._estado = {grupo: {} for grupo in GRUPOS}
+        if estado is not None:
+            for grupo, valores in estado.items():
+                self._estado.setdefault(grupo, {}).update(valores)
+        elif db is not None:
+            for colecao, registros in db.items():
+                for registro in registros:
+                    self._add(contribution(colecao, registro))
+
+    @classmethod
+    def from_rows(cls, linhas):
+        agregados = cls()
+        agregados._add(linhas)
+        return agregados
+
+    def _add(self, variacoes):
+        for grupo, chave, valor in variacoes:
+            contadores = self._estado.setdefault(grupo, {})
+            contadores[chave] = contadores.get(chave, 0) + valor
+            if not contadores[chave]:
+                del contadores[chave]
+
+    def add(self, colecao, registro):
+        with self._lock:
+            self._add(contribution(colecao, registro))
+
+    # Soma com outras estatísticas (as dos atendimentos arquivados, por exemplo)
+    def merged(self, outro):
+        soma = Aggregates(estado=self.state())
+        soma._add(outro.rows())
+        return soma
+
+    # Manutenção incremental, como nos demais derivados do storage
+    def apply(self, db, entrada, anterior, pos):
+        with self._lock:
+            self._add(deltas(entrada, anterior))
+
+    # Cópia do estado (grupo -> {chave: valor}), para exibição e para gravar junto ao banco
+    def state(self):
+        with self._lock:
+            return {grupo: dict(valores) for grupo, valores in self._estado.items()}
+
+    def rows(self):
+        return [(grupo, chave, valor) for grupo, valores in self.state().items() for chave, valor in valores.items()]
+
+    def total(self, colecao):
+        return self._estado["total"].get(colecao, 0)
+
+    # Consumo das propostas: horas contratadas e atendimentos lançados, das mais atendidas para as menos
+    def consumption(self):
+        estado = self.state()
+        propostas = set(estado["horas_proposta"]) | set(estado["atendimentos_proposta"])
+        linhas = [
+            {
+                "idNumPropostas": proposta,
+                "idHorasContratadas": estado["horas_proposta"].get(proposta, 0),
+                "atendimentos": estado["atendimentos_proposta"].get(proposta, 0)
+            }
+            for proposta in propostas if proposta
+        ]
+        return sorted(linhas, key=lambda linha: (-linha["atendimentos"], linha["idNumPropostas"]))
@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import traceback
+import uuid
+from http import HTTPStatus
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import storage
+from profiling import prometheus_text, record_bytes, span
+from records import json_default
+from validation import VALIDADORES, complete_record, parse_date
+
+# API HTTP/JSON do banco, para integrações (sincronização com o portal SEBRAETEC, relatórios), servida
+# ao lado do app.py sobre o mesmo storage e a mesma validação:
+#
+#   GET  /api/<coleção>?pagina=&tamanho=&ordenar_por=&crescente=&busca=&status=&consultor=&etapa=
+#   POST /api/<coleção>                 inclui um registro
+#   GET  /api/<coleção>/<chave>         um registro (atendimentos pelo idAtendimento)
+#   PUT  /api/<coleção>/<chave>         altera os campos enviados
+#   DELETE /api/<coleção>/<chave>       exclui um registro
+#   POST /api/<coleção>/lote            inclui uma lista de registros numa única gravação
+#   PUT  /api/<coleção>/lote            altera uma lista de registros (cada um com a sua chave)
+#   GET  /metrics                       estatísticas dos trechos instrumentados (Prometheus)
+#
+# Os GETs levam ETag pela versão dos dados (If-None-Match responde 304) e as respostas são
+# comprimidas com gzip quando o cliente aceita. Com JTD_API_TOKEN definido, toda requisição
+# precisa do cabeçalho "Authorization: Bearer <token>"
+
+COLECOES = ("atendimentos", "propostas", "consultores", "etapas")
+TAMANHO_PADRAO = 50
+TAMANHO_MAXIMO = 500
+CORPO_MAXIMO = 16 * 1024 * 1024
+GZIP_MINIMO = 1024
+# Segundos de espera por uma nova requisição numa conexão mantida aberta
+KEEPALIVE = 30
+
+# Grupo das estatísticas que conta, por chave, os atendimentos (ativos e arquivados) que a referenciam
+REFERENCIAS = {"propostas": "atendimentos_proposta", "consultores": "consultor", "etapas": "etapa"}
+
+# Identifica esta execução do servidor nas ETags: a versão dos dados recomeça a cada processo
+_EXECUCAO = uuid.uuid4().hex[:8]
+
+# Erro devolvido ao cliente como {"erro": mensagem, "erros": [...]}
+class ApiError(Exception):
+    def __init__(self, status, mensagem, erros=None):
+        super().__init__(mensagem)
+        self.status = status
+        self.erros = erros
+
+def _chave(colecao):
+    return "idAtendimento" if colecao == "atendimentos" else storage.CHAVES[colecao]
+
+def _inteiro(consulta, nome, padrao, minimo=1, maximo=None):
+    try:
+        valor = int(consulta.get(nome, padrao))
+    except ValueError:
+        raise ApiError(400, f"{nome} deve ser um número inteiro")
+    if valor < minimo or (maximo is not None and valor > maximo):
+        raise ApiError(400, f"{nome} deve estar entre {minimo} e {maximo}" if maximo else f"{nome} deve ser no mínimo {minimo}")
+    return valor
+
+def _json_body(corpo):
+    try:
+        return json.loads(corpo or b"null")
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise ApiError(400, "Corpo da requisição não é um JSON válido")
+
+# Só os campos da coleção; idAtendimento e versao são controlados pelo storage
+def _campos(colecao, dados):
+    if not isinstance(dados, dict):
+        raise ApiError(400, "Cada registro deve ser um objeto JSON")
+    return {
+        campo: dados[campo] for campo in storage.CAMPOS[colecao]
+        if campo in dados and campo not in ("idAtendimento", "versao")
+    }
+
+# Datas aceitas pela validação (AAAA-MM-DD ou DD/MM/AAAA) são gravadas como AAAA-MM-DD
+def _normalize_dates(registro):
+    for campo in ("idData", "idDataVisita"):
+        if registro.get(campo):
+            registro[campo] = parse_date(registro[campo])
+    return registro
+
+def _find(backend, db, colecao, chave):
+    if colecao == "atendimentos":
+        return backend.find_atendimento(db, chave)
+    return getattr(backend.get_indexes(db), colecao).get(chave)
+
+def _list(backend, db, colecao, consulta):
+    from frames import ORDENACOES
+    pagina = _inteiro(consulta, "pagina", 1)
+    tamanho = _inteiro(consulta, "tamanho", TAMANHO_PADRAO, maximo=TAMANHO_MAXIMO)
+    ordenar_por = consulta.get("ordenar_por") or None
+    if ordenar_por is not None and ordenar_por not in ORDENACOES:
+        raise ApiError(400, f"ordenar_por deve ser um de: {', '.join(ORDENACOES)}")
+    crescente = consulta.get("crescente", "1").lower() not in ("0", "false", "nao", "não")
+    busca = consulta.get("busca")
+    if colecao == "atendimentos":
+        filtros = {campo: consulta.get(campo) or None for campo in ("status", "consultor", "etapa")}
+        if busca:
+            tabela, total = backend.search_atendimentos(busca, limite=pagina * tamanho, **filtros)
+            posicoes = list(tabela.index[(pagina - 1) * tamanho:])
+        else:
+            tabela, total = backend.page_atendimentos(ordenar_por=ordenar_por, crescente=crescente,
+                                                      pagina=pagina, tamanho=tamanho, **filtros)
+            posicoes = list(tabela.index)
+    elif colecao == "propostas":
+        if busca:
+            tabela, total = backend.search_propostas(busca, limite=pagina * tamanho)
+            posicoes = list(tabela.index[(pagina - 1) * tamanho:])
+        else:
+            tabela, total = backend.page_propostas(ordenar_por, crescente, pagina, tamanho)
+            posicoes = list(tabela.index)
+    else:
+        total = len(db[colecao])
+        posicoes = range((pagina - 1) * tamanho, min(total, pagina * tamanho))
+    # As listagens devolvem as posições; os registros completos vêm do banco em cache
+    registros = backend.load_database()[colecao]
+    return {"registros": [registros[pos] for pos in posicoes], "total": total, "pagina": pagina, "tamanho": tamanho}
+
+# Valida uma lista de registros novos como a importação: todos contra o banco e as chaves já aceitas na lista
+def _validate_new(indices, colecao, registros):
+    validar = VALIDADORES[colecao]
+    chaves, erros = set(), []
+    for i, registro in enumerate(registros):
+        erros.extend({"indice": i, "erro": erro} for erro in validar(registro, indices, chaves))
+        if colecao != "atendimentos":
+            chaves.add(registro.get(storage.CHAVES[colecao]))
+    return erros
+
+def _create(backend, db, colecao, corpo):
+    registro = complete_record(colecao, _campos(colecao, _json_body(corpo)))
+    erros = VALIDADORES[colecao](registro, backend.get_indexes(db))
+    if erros:
+        raise ApiError(422, "Registro inválido", erros)
+    backend.insert_record(db, colecao, _normalize_dates(registro))
+    return registro
+
+def _create_many(backend, db, colecao, corpo):
+    dados = _json_body(corpo)
+    if not isinstance(dados, list) or not dados:
+        raise ApiError(400, "O corpo deve ser uma lista não vazia de registros")
+    registros = [complete_record(colecao, _campos(colecao, item)) for item in dados]
+    erros = _validate_new(backend.get_indexes(db), colecao, registros)
+    if erros:
+        raise ApiError(422, "Nada foi gravado: há registros inválidos", erros)
+    backend.insert_many(db, colecao, [_normalize_dates(registro) for registro in registros])
+    return {"registros": registros, "total": len(registros)}
+
+# Alteração: os campos enviados substituem os atuais, menos a chave. Nos atendimentos, "versao" é a versão lida
+# pelo cliente; se o registro mudou desde então, a alteração é recusada (409)
+def _changed(backend, db, colecao, chave, dados):
+    atual = _find(backend, db, colecao, chave)
+    if atual is None:
+        raise ApiError(404, f"{chave} não encontrado em {colecao}")
+    campos = _campos(colecao, dados)
+    # A chave não muda: os atendimentos continuariam apontando para a chave antiga
+    campo = _chave(colecao)
+    if colecao != "atendimentos" and campo in campos and campos[campo] != chave:
+        return None, None, [f"{campo} não pode ser alterado ({chave})"]
+    registro = dict(atual.copy(), **campos)
+    versao_esperada = dados.get("versao") if colecao == "atendimentos" else None
+    erros = VALIDADORES[colecao](registro, backend.get_indexes(db), atual=chave)
+    return registro, versao_esperada, erros
+
+def _update(backend, db, colecao, chave, corpo):
+    registro, versao_esperada, erros = _changed(backend, db, colecao, chave, _json_body(corpo))
+    if erros:
+        raise ApiError(422, "Registro inválido", erros)
+    backend.update_record(db, colecao, chave, _normalize_dates(registro), versao_esperada)
+    return registro
+
+def _update_many(backend, db, colecao, corpo):
+    dados = _json_body(corpo)
+    if not isinstance(dados, list) or not dados:
+        raise ApiError(400, "O corpo deve ser uma lista não vazia de registros")
+    campo = _chave(colecao)
+    alteracoes, erros = [], []
+    for i, item in enumerate(dados):
+        if not isinstance(item, dict) or not item.get(campo):
+            raise ApiError(400, f"Cada registro deve trazer o campo {campo}")
+        try:
+            registro, versao_esperada, problemas = _changed(backend, db, colecao, item[campo], item)
+        except ApiError as erro:
+            problemas = [str(erro)]
+        erros.extend({"indice": i, "erro": problema} for problema in problemas)
+        if not problemas:
+            alteracoes.append((item[campo], _normalize_dates(registro), versao_esperada))
+    if erros:
+        raise ApiError(422, "Nada foi gravado: há registros inválidos", erros)
+    backend.update_many(db, colecao, alteracoes)
+    return {"registros": [registro for _, registro, _ in alteracoes], "total": len(alteracoes)}
+
+# Exclusão: propostas, consultores e etapas ainda referenciados por atendimentos são mantidos (409);
+# nos atendimentos, ?versao= é a versão lida pelo cliente, conferida como na alteração
+def _delete(backend, db, colecao, chave, consulta):
+    if _find(backend, db, colecao, chave) is None:
+        raise ApiError(404, f"{chave} não encontrado em {colecao}")
+    versao_esperada = None
+    if colecao == "atendimentos":
+        if "versao" in consulta:
+            versao_esperada = _inteiro(consulta, "versao", 0, minimo=0)
+    else:
+        estatisticas = backend.get_aggregates(db).merged(backend.get_archive().aggregates()).state()
+        referencias = estatisticas.get(REFERENCIAS[colecao], {}).get(chave, 0)
+        if referencias:
+            raise ApiError(409, f"{chave} é referenciado por {referencias} atendimentos")
+    backend.delete_record(db, colecao, chave, versao_esperada)
+
+def _etag(backend):
+    return f'"{_EXECUCAO}-{backend.data_version()}"'
+
+# Trata uma requisição (numa thread: o storage faz E/S bloqueante); retorna (status, conteúdo, cabeçalhos)
+def handle(backend, metodo, alvo, cabecalhos, corpo=b""):
+    token = os.environ.get("JTD_API_TOKEN")
+    if token and cabecalhos.get("authorization") != f"Bearer {token}":
+        return 401, {"erro": "Token ausente ou inválido"}, {"WWW-Authenticate": "Bearer"}
+    partes = urlsplit(alvo)
+    caminho = [unquote(parte) for parte in partes.path.strip("/").split("/")]
+    consulta = {nome: valores[-1] for nome, valores in parse_qs(partes.query).items()}
+    if caminho == ["metrics"] and metodo == "GET":
+        return 200, prometheus_text(), {}
+    if len(caminho) not in (2, 3) or caminho[0] != "api" or caminho[1] not in COLECOES:
+        return 404, {"erro": "Rota não encontrada"}, {}
+    colecao = caminho[1]
+    chave = caminho[2] if len(caminho) == 3 else None
+    try:
+        db = backend.load_database()
+        if metodo == "GET":
+            etag = _etag(backend)
+            if etag in cabecalhos.get("if-none-match", ""):
+                return 304, None, {"ETag": etag}
+            if chave is None:
+                return 200, _list(backend, db, colecao, consulta), {"ETag": etag}
+            registro = _find(backend, db, colecao, chave)
+            if registro is None:
+                raise ApiError(404, f"{chave} não encontrado em {colecao}")
+            return 200, registro, {"ETag": etag}
+        if metodo == "POST" and chave is None:
+            registro = _create(backend, db, colecao, corpo)
+            return 201, registro, {"Location": f"/api/{colecao}/{quote(str(registro.get(_chave(colecao))))}"}
+        if metodo == "POST" and chave == "lote":
+            return 201, _create_many(backend, db, colecao, corpo), {}
+        if metodo == "PUT" and chave == "lote":
+            return 200, _update_many(backend, db, colecao, corpo), {}
+        if metodo == "PUT" and chave is not None:
+            return 200, _update(backend, db, colecao, chave, corpo), {}
+        if metodo == "DELETE" and chave is not None:
+            _delete(backend, db, colecao, chave, consulta)
+            return 204, None, {}
+        return 405, {"erro": f"Método {metodo} não permitido nesta rota"}, {"Allow": "GET, POST, PUT, DELETE"}
+    except ApiError as erro:
+        conteudo = {"erro": str(erro)}
+        if erro.erros:
+            conteudo["erros"] = erro.erros
+        return erro.status, conteudo, {}
+    except storage.VersionConflict as conflito:
+        return 409, {"erro": f"{conflito} foi alterado por outra sessão; leia o registro novamente"}, {}
+
+def _response(status, conteudo, extras, cabecalhos, manter):
+    if conteudo is None:
+        corpo, tipo = b"", None
+    elif isinstance(conteudo, str):
+        corpo, tipo = conteudo.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        corpo, tipo = json.dumps(conteudo, ensure_ascii=False, default=json_default).encode("utf-8"), "application/json; charset=utf-8"
+    linhas = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+    if tipo:
+        linhas.append(f"Content-Type: {tipo}")
+        linhas.append("Vary: Accept-Encoding")
+        if len(corpo) >= GZIP_MINIMO and "gzip" in cabecalhos.get("accept-encoding", ""):
+            corpo = gzip.compress(corpo, compresslevel=6)
+            linhas.append("Content-Encoding: gzip")
+    linhas += [f"{nome}: {valor}" for nome, valor in extras.items()]
+    # 204 não leva corpo nem Content-Length
+    if status != 204:
+        linhas.append(f"Content-Length: {len(corpo)}")
+    linhas.append("Connection: " + ("keep-alive" if manter else "close"))
+    return ("\r\n".join(linhas) + "\r\n\r\n").encode("latin-1") + corpo
+
+async def _read_request(reader):
+    linha = await asyncio.wait_for(reader.readline(), KEEPALIVE)
+    if not linha.strip():
+        return None
+    try:
+        metodo, alvo, versao = linha.decode("latin-1").split()
+    except ValueError:
+        raise ApiError(400, "Linha de requisição inválida")
+    cabecalhos = {}
+    while True:
+        linha = await reader.readline()
+        if linha in (b"\r\n", b"\n", b""):
+            break
+        nome, _, valor = linha.decode("latin-1").partition(":")
+        cabecalhos[nome.strip().lower()] = valor.strip()
+    if "chunked" in cabecalhos.get("transfer-encoding", "").lower():
+        raise ApiError(411, "Envie o corpo com Content-Length")
+    try:
+        tamanho = int(cabecalhos.get("content-length") or 0)
+    except ValueError:
+        raise ApiError(400, "Content-Length inválido")
+    if tamanho > CORPO_MAXIMO:
+        raise ApiError(413, "Corpo da requisição muito grande")
+    corpo = await reader.readexactly(tamanho) if tamanho else b""
+    return metodo.upper(), alvo, versao, cabecalhos, corpo
+
+# Uma conexão: requisições em sequência enquanto o cliente a mantiver aberta (HTTP/1.1)
+async def _serve_connection(backend, reader, writer):
+    try:
+        while True:
+            try:
+                requisicao = await _read_request(reader)
+            except ApiError as erro:
+                writer.write(_response(erro.status, {"erro": str(erro)}, {}, {}, False))
+                await writer.drain()
+                break
+            if requisicao is None:
+                break
+            metodo, alvo, versao, cabecalhos, corpo = requisicao
+            with span("api.request"):
+                try:
+                    status, conteudo, extras = await asyncio.to_thread(handle, backend, metodo, alvo, cabecalhos, corpo)
+                except Exception as erro:
+                    traceback.print_exc()
+                    status, conteudo, extras = 500, {"erro": f"Erro interno: {erro}"}, {}
+                manter = versao == "HTTP/1.1" and cabecalhos.get("connection", "").lower() != "close"
+                resposta = _response(status, conteudo, extras, cabecalhos, manter)
+                writer.write(resposta)
+                await writer.drain()
+            record_bytes("api.request", lidos=len(corpo), gravados=len(resposta))
+            if not manter:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host="127.0.0.1", porta=8502, path=None):
+    backend = storage.get_storage(path)
+    servidor = await asyncio.start_server(lambda r, w: _serve_connection(backend, r, w), host, porta)
+    print(f"API do Sistema de Atendimentos em http://{host}:{porta}/api (banco {backend.path})", flush=True)
+    async with servidor:
+        await servidor.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP/JSON do Sistema de Atendimentos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8502)
+    parser.add_argument("--db", default=storage.DB_FILE, help="Arquivo do banco (padrão: %(default)s)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.porta, args.db))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
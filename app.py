@@ -1,32 +1,23 @@
 import streamlit as st
-import json
+import functools
+import math
 import os
 from datetime import datetime
 
+from storage import (load_database, insert_record, update_record, page_atendimentos, page_propostas, get_aggregates,
+                     search_atendimentos, search_propostas, get_search, find_atendimento, get_indexes, data_version,
+                     get_archive, cache_stats, lock_stats, VersionConflict)
+from profiling import span
+from validation import VALIDADORES
+
 # Configuração inicial
-DB_FILE = "database.json"
 st.set_page_config(page_title="Sistema de Atendimentos", layout="wide")
 
-# Carregar ou inicializar o banco de dados
-def load_database():
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, "r", encoding='utf-8') as f:
-            return json.load(f)
-    return {
-        "atendimentos": [],
-        "consultores": [],
-        "etapas": [
-            {"id_etapa": "1", "descricao": "Primeiro Contato"},
-            {"id_etapa": "2", "descricao": "Análise de Necessidades"},
-            {"id_etapa": "3", "descricao": "Proposta Enviada"},
-            {"id_etapa": "4", "descricao": "Fechamento"}
-        ],
-        "propostas": []
-    }
+# Quantidade de atendimentos oferecidos no seletor da edição
+OPCOES_EDICAO = 50
 
-def save_database(data):
-    with open(DB_FILE, "w", encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+PAGINAS = ["Cadastrar Atendimento", "Listar Atendimentos", "Editar Atendimento",
+           "Gerenciar Propostas", "Gerenciar Consultores", "Gerenciar Etapas", "Importar Dados", "Exportar Dados"]
 
 # Funções auxiliares
 def format_date(date_str):
@@ -34,460 +25,763 @@ def format_date(date_str):
         return date_str.split("T")[0]
     return date_str
 
+# Valida pelas mesmas regras da importação e da API e mostra os erros; atual: chave do registro em edição
+def validate_form(db, colecao, registro, atual=None):
+    erros = VALIDADORES[colecao](registro, get_indexes(db), atual=atual)
+    for erro in erros:
+        st.error(erro)
+    return not erros
+
 def get_consultores(db):
     return [c["id_consultores"] for c in db["consultores"] if c.get("id_consultores")]
 
 def get_propostas(db):
     return [p["idNumPropostas"] for p in db["propostas"] if p.get("idNumPropostas")]
 
+def atendimento_label(atendimento):
+    return f"{atendimento['idNumPropostas']} - {atendimento['idRazaoSocial']} ({format_date(atendimento.get('idData')) or 'sem data'})"
+
 def get_etapas(db):
     return [(e["id_etapa"], e["descricao"]) for e in db["etapas"] if e.get("id_etapa")]
 
-# Interface Streamlit
-def main():
-    st.title("📋 Sistema de Gerenciamento de Atendimentos")
+# Listas de opções dos formulários e filtros, compartilhadas entre as sessões e recalculadas
+# só quando a versão dos dados muda
+@st.cache_resource(max_entries=4, show_spinner=False)
+def option_lists(versao):
+    db = load_database()
+    return {"consultores": get_consultores(db), "propostas": get_propostas(db), "etapas": get_etapas(db)}
+
+def get_options():
+    load_database()
+    return option_lists(data_version())
+
+# Controles de paginação e ordenação das listagens; retorna (ordenar_por, crescente, pagina, tamanho)
+def pagination_controls(chave):
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        ordenar_por = st.selectbox(
+            "Ordenar por",
+            ["idData", "idNumPropostas", None],
+            format_func=lambda x: {"idData": "Data", "idNumPropostas": "Nº Proposta", None: "Ordem de cadastro"}[x],
+            key=f"{chave}_ordenar_por"
+        )
+    with col2:
+        crescente = st.selectbox(
+            "Direção",
+            [False, True],
+            format_func=lambda x: "Crescente" if x else "Decrescente",
+            key=f"{chave}_crescente"
+        )
+    with col3:
+        tamanho = st.selectbox("Itens por página", [25, 50, 100, 500], key=f"{chave}_tamanho")
+    with col4:
+        pagina = st.number_input("Página", min_value=1, step=1, key=f"{chave}_pagina")
+    return ordenar_por, crescente, int(pagina), tamanho
+
+# Busca a página pedida; se ela passou do fim (filtros mudaram), mostra a última
+def fetch_page(consulta, pagina, tamanho):
+    tabela, total = consulta(pagina)
+    paginas = max(1, math.ceil(total / tamanho))
+    if pagina > paginas:
+        pagina = paginas
+        tabela, total = consulta(pagina)
+    st.caption(f"{total} registros — página {pagina} de {paginas}")
+    return tabela
+
+# A página de diagnóstico só aparece com ?admin=<JTD_ADMIN_TOKEN> na URL
+def is_admin():
+    token = os.environ.get("JTD_ADMIN_TOKEN")
+    return bool(token) and st.query_params.get("admin") == token
+
+# Páginas do menu: cada uma roda como um fragmento (st.fragment), então interagir com os seus
+# widgets reexecuta só a página, sem o título, o menu e as demais páginas
+RENDERIZADORES = {}
+
+def page(nome):
+    def registrar(funcao):
+        @st.fragment
+        @functools.wraps(funcao)
+        def renderizar():
+            # A captura de perfil fica aqui, e não em run(): interagir com um widget reexecuta só o
+            # fragmento da página, e é essa execução que o usuário quer analisar
+            with span(f"pagina.{nome}"):
+                if st.session_state.pop("capturar_perfil", False):
+                    from profiling import profile_call
+                    profile_call(funcao, lambda perfil: st.session_state.update(perfil=perfil))
+                else:
+                    funcao()
+        RENDERIZADORES[nome] = renderizar
+        return renderizar
+    return registrar
+
+@page("Cadastrar Atendimento")
+def render_cadastrar_atendimento():
+    st.header("Novo Atendimento")
     
-    # Menu lateral
-    menu_option = st.sidebar.selectbox(
-        "Menu Principal",
-        ["Cadastrar Atendimento", "Listar Atendimentos", "Editar Atendimento", 
-         "Gerenciar Propostas", "Gerenciar Consultores", "Gerenciar Etapas", "Exportar Dados"]
-    )
+    db = load_database()
+    opcoes = get_options()
+    
+    with st.form("form_atendimento"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            idChecagem = st.selectbox("Status", ["Não Lançado", "Lançado"])
+            
+            # Combobox para Propostas
+            propostas_disponiveis = opcoes["propostas"]
+            idNumPropostas = st.selectbox(
+                "Nº Proposta",
+                options=propostas_disponiveis,
+                index=0 if propostas_disponiveis else None,
+                format_func=lambda x: f"Proposta: {x}" if x else "Nenhuma proposta cadastrada"
+            )
+            
+            idRazaoSocial = st.text_input("Razão Social")
+            
+            # Combobox para Etapas
+            etapas_disponiveis = opcoes["etapas"]
+            idEtapa = st.selectbox(
+                "Etapa",
+                options=etapas_disponiveis,
+                format_func=lambda x: f"{x[0]} - {x[1]}",
+                index=0 if etapas_disponiveis else None
+            )
+            
+            idObservacao = st.text_area("Observações")
+            
+        with col2:
+            idHoraVisita = st.text_input("Hora Visita")
+            idDataVisita = st.date_input("Data Visita", datetime.now())
+            
+            # Combobox para Consultores
+            consultores_disponiveis = opcoes["consultores"]
+            idConsultor = st.selectbox(
+                "Consultor",
+                options=consultores_disponiveis,
+                index=0 if consultores_disponiveis else None,
+                format_func=lambda x: x if x else "Nenhum consultor cadastrado"
+            )
+            
+            idAtendNIF = st.text_input("NIF Atendimento")
+            idCNPJ = st.text_input("CNPJ")
+            idProduto = st.text_input("Produto")
+            idHoraAtend = st.text_input("Hora Atendimento")
+            idData = st.date_input("Data Atendimento", datetime.now())
+        
+        if st.form_submit_button("Salvar Atendimento"):
+            novo_atendimento = {
+                "idChecagem": idChecagem,
+                "idNumPropostas": idNumPropostas,
+                "idRazaoSocial": idRazaoSocial,
+                "idEtapa": idEtapa[0] if idEtapa else None,
+                "idObservacao": idObservacao if idObservacao else None,
+                "idHoraVisita": idHoraVisita,
+                "idDataVisita": str(idDataVisita),
+                "idConsultor": idConsultor,
+                "idAtendNIF": idAtendNIF,
+                "idCNPJ": idCNPJ,
+                "idProduto": idProduto,
+                "idHoraAtend": idHoraAtend if idHoraAtend else None,
+                "idData": str(idData)
+            }
+            
+            if validate_form(db, "atendimentos", novo_atendimento):
+                insert_record(db, "atendimentos", novo_atendimento)
+                st.success("Atendimento cadastrado com sucesso!")
+                st.balloons()
+
+@page("Listar Atendimentos")
+def render_listar_atendimentos():
+    st.header("Lista de Atendimentos")
     
     db = load_database()
+    opcoes = get_options()
+    
+    busca = st.text_input("Buscar", placeholder="Razão Social, CNPJ, Produto, Observações ou Nº Proposta")
     
-    if menu_option == "Cadastrar Atendimento":
-        st.header("Novo Atendimento")
-        with st.form("form_atendimento"):
+    # Filtros
+    col_filtro1, col_filtro2, col_filtro3 = st.columns(3)
+    with col_filtro1:
+        filtro_status = st.selectbox("Filtrar por Status", ["Todos", "Lançado", "Não Lançado"])
+    with col_filtro2:
+        filtro_consultor = st.selectbox(
+            "Filtrar por Consultor",
+            ["Todos"] + opcoes["consultores"]
+        )
+    with col_filtro3:
+        filtro_etapa = st.selectbox(
+            "Filtrar por Etapa",
+            [None] + opcoes["etapas"],
+            format_func=lambda x: "Todos" if x is None else f"{x[0]} - {x[1]}"
+        )
+    
+    filtros = {
+        "status": None if filtro_status == "Todos" else filtro_status,
+        "consultor": None if filtro_consultor == "Todos" else filtro_consultor,
+        "etapa": None if filtro_etapa is None else filtro_etapa[0]
+    }
+    
+    if busca:
+        # Busca no índice invertido: só os resultados mais relevantes são enviados ao navegador
+        atendimentos_filtrados, total = search_atendimentos(busca, limite=100, **filtros)
+        st.caption(f"{total} resultados" + (" — mostrando os 100 mais relevantes" if total > 100 else ""))
+    else:
+        ordenar_por, crescente, pagina, tamanho = pagination_controls("atendimentos")
+        
+        # Os filtros são aplicados pelo backend (máscaras no DataFrame, cláusulas WHERE no SQLite)
+        # e só a página visível é enviada ao navegador
+        atendimentos_filtrados = fetch_page(
+            lambda p: page_atendimentos(
+                **filtros,
+                ordenar_por=ordenar_por,
+                crescente=crescente,
+                pagina=p,
+                tamanho=tamanho
+            ),
+            pagina,
+            tamanho
+        )
+    
+    if not atendimentos_filtrados.empty:
+        st.dataframe(
+            atendimentos_filtrados,
+            column_order=["idNumPropostas", "idRazaoSocial", "idCNPJ", "idConsultor", "idChecagem", "idData", "etapa_desc"],
+            column_config={
+                "idNumPropostas": "Proposta",
+                "idRazaoSocial": "Razão Social",
+                "idCNPJ": "CNPJ",
+                "idConsultor": "Consultor",
+                "idChecagem": "Status",
+                "idData": "Data",
+                "etapa_desc": "Etapa"
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.warning("Nenhum atendimento encontrado com os filtros selecionados.")
+    
+    # Atendimentos encerrados movidos para o arquivo (python manage.py archive): somente leitura,
+    # e só as partições dos meses escolhidos são lidas do disco
+    arquivo = get_archive()
+    meses = arquivo.months()
+    if meses:
+        with st.expander(f"Atendimentos arquivados ({arquivo.total()})"):
+            if st.toggle("Consultar o arquivo", key="listar_arquivo"):
+                inicio, fim = st.select_slider(
+                    "Meses",
+                    options=meses,
+                    value=(meses[-1], meses[-1]),
+                    format_func=lambda mes: mes or "(sem data)"
+                )
+                indices = get_indexes(db)
+                arquivados = [
+                    dict(atendimento, etapa_desc=indices.etapa_desc(atendimento.get("idEtapa")))
+                    for mes in meses if inicio <= mes <= fim
+                    for atendimento in arquivo.load_month(mes)
+                    if all(valor is None or atendimento.get(campo) == valor for campo, valor in (
+                        ("idChecagem", filtros["status"]),
+                        ("idConsultor", filtros["consultor"]),
+                        ("idEtapa", filtros["etapa"])
+                    ))
+                ]
+                st.caption(f"{len(arquivados)} atendimentos arquivados no período")
+                st.dataframe(
+                    arquivados,
+                    column_order=["idNumPropostas", "idRazaoSocial", "idCNPJ", "idConsultor", "idChecagem", "idData", "etapa_desc"],
+                    column_config={
+                        "idNumPropostas": "Proposta",
+                        "idRazaoSocial": "Razão Social",
+                        "idCNPJ": "CNPJ",
+                        "idConsultor": "Consultor",
+                        "idChecagem": "Status",
+                        "idData": "Data",
+                        "etapa_desc": "Etapa"
+                    },
+                    hide_index=True,
+                    use_container_width=True
+                )
+
+@page("Editar Atendimento")
+def render_editar_atendimento():
+    st.header("Editar Atendimento")
+    
+    db = load_database()
+    opcoes = get_options()
+    
+    if not db["atendimentos"]:
+        st.warning("Nenhum atendimento cadastrado para editar.")
+    else:
+        # Só as opções necessárias vão para o navegador: os resultados da busca ou, sem busca,
+        # os atendimentos mais recentes; a escolha é guardada pelo idAtendimento
+        busca = st.text_input("Buscar atendimento", placeholder="Razão Social, CNPJ, Produto, Observações ou Nº Proposta")
+        if busca:
+            posicoes = get_search(db).search(busca, limite=OPCOES_EDICAO)
+        else:
+            posicoes = range(len(db["atendimentos"]) - 1, max(-1, len(db["atendimentos"]) - 1 - OPCOES_EDICAO), -1)
+        escolhas = [db["atendimentos"][pos]["idAtendimento"] for pos in posicoes]
+        
+        # Mantém o atendimento escolhido entre as opções enquanto a busca muda
+        selecionado = st.session_state.get("editar_id")
+        if selecionado and selecionado not in escolhas and find_atendimento(db, selecionado) is not None:
+            escolhas.insert(0, selecionado)
+        
+        if not escolhas:
+            st.warning("Nenhum atendimento encontrado para a busca.")
+            st.stop()
+        
+        id_atendimento = st.selectbox(
+            "Selecione o atendimento",
+            escolhas,
+            format_func=lambda id_atendimento: atendimento_label(find_atendimento(db, id_atendimento)),
+            key="editar_id"
+        )
+        atendimento = find_atendimento(db, id_atendimento)
+        
+        # Versão exibida na execução anterior (a que o usuário editou), para detectar alterações concorrentes
+        chave_versao = f"versao_lida_{atendimento['idAtendimento']}"
+        versao_lida = st.session_state.get(chave_versao, atendimento.get("versao") or 0)
+        st.session_state[chave_versao] = atendimento.get("versao") or 0
+        
+        with st.form("form_editar_atendimento"):
             col1, col2 = st.columns(2)
             
             with col1:
-                idChecagem = st.selectbox("Status", ["Não Lançado", "Lançado"])
+                novo_idChecagem = st.selectbox(
+                    "Status", 
+                    ["Não Lançado", "Lançado"],
+                    index=0 if atendimento["idChecagem"] == "Não Lançado" else 1
+                )
                 
                 # Combobox para Propostas
-                propostas_disponiveis = get_propostas(db)
-                idNumPropostas = st.selectbox(
+                propostas_disponiveis = opcoes["propostas"]
+                novo_idNumPropostas = st.selectbox(
                     "Nº Proposta",
                     options=propostas_disponiveis,
-                    index=0 if propostas_disponiveis else None,
-                    format_func=lambda x: f"Proposta: {x}" if x else "Nenhuma proposta cadastrada"
+                    index=propostas_disponiveis.index(atendimento["idNumPropostas"]) if atendimento["idNumPropostas"] in propostas_disponiveis else 0
                 )
                 
-                idRazaoSocial = st.text_input("Razão Social")
+                novo_idRazaoSocial = st.text_input("Razão Social", value=atendimento["idRazaoSocial"])
                 
                 # Combobox para Etapas
-                etapas_disponiveis = get_etapas(db)
-                idEtapa = st.selectbox(
+                etapas_disponiveis = opcoes["etapas"]
+                etapa_atual = next((e for e in etapas_disponiveis if e[0] == atendimento["idEtapa"]), None)
+                novo_idEtapa = st.selectbox(
                     "Etapa",
                     options=etapas_disponiveis,
                     format_func=lambda x: f"{x[0]} - {x[1]}",
-                    index=0 if etapas_disponiveis else None
+                    index=etapas_disponiveis.index(etapa_atual) if etapa_atual in etapas_disponiveis else 0
                 )
                 
-                idObservacao = st.text_area("Observações")
+                novo_idObservacao = st.text_area(
+                    "Observações", 
+                    value=atendimento["idObservacao"] if atendimento["idObservacao"] else ""
+                )
                 
             with col2:
-                idHoraVisita = st.text_input("Hora Visita")
-                idDataVisita = st.date_input("Data Visita", datetime.now())
+                novo_idHoraVisita = st.text_input("Hora Visita", value=atendimento["idHoraVisita"])
+                novo_idDataVisita = st.date_input(
+                    "Data Visita", 
+                    value=datetime.strptime(atendimento["idDataVisita"], "%Y-%m-%d") if atendimento["idDataVisita"] else datetime.now()
+                )
                 
                 # Combobox para Consultores
-                consultores_disponiveis = get_consultores(db)
-                idConsultor = st.selectbox(
+                consultores_disponiveis = opcoes["consultores"]
+                novo_idConsultor = st.selectbox(
                     "Consultor",
                     options=consultores_disponiveis,
-                    index=0 if consultores_disponiveis else None,
-                    format_func=lambda x: x if x else "Nenhum consultor cadastrado"
+                    index=consultores_disponiveis.index(atendimento["idConsultor"]) if atendimento["idConsultor"] in consultores_disponiveis else 0
                 )
                 
-                idAtendNIF = st.text_input("NIF Atendimento")
-                idCNPJ = st.text_input("CNPJ")
-                idProduto = st.text_input("Produto")
-                idHoraAtend = st.text_input("Hora Atendimento")
-                idData = st.date_input("Data Atendimento", datetime.now())
+                novo_idAtendNIF = st.text_input("NIF Atendimento", value=atendimento["idAtendNIF"])
+                novo_idCNPJ = st.text_input("CNPJ", value=atendimento["idCNPJ"])
+                novo_idProduto = st.text_input("Produto", value=atendimento["idProduto"])
+                novo_idHoraAtend = st.text_input(
+                    "Hora Atendimento", 
+                    value=atendimento["idHoraAtend"] if atendimento["idHoraAtend"] else ""
+                )
+                novo_idData = st.date_input(
+                    "Data Atendimento", 
+                    value=datetime.strptime(atendimento["idData"], "%Y-%m-%d") if atendimento["idData"] else datetime.now()
+                )
             
-            if st.form_submit_button("Salvar Atendimento"):
-                novo_atendimento = {
-                    "idChecagem": idChecagem,
-                    "idNumPropostas": idNumPropostas,
-                    "idRazaoSocial": idRazaoSocial,
-                    "idEtapa": idEtapa[0] if idEtapa else None,
-                    "idObservacao": idObservacao if idObservacao else None,
-                    "idHoraVisita": idHoraVisita,
-                    "idDataVisita": str(idDataVisita),
-                    "idConsultor": idConsultor,
-                    "idAtendNIF": idAtendNIF,
-                    "idCNPJ": idCNPJ,
-                    "idProduto": idProduto,
-                    "idHoraAtend": idHoraAtend if idHoraAtend else None,
-                    "idData": str(idData),
-                    "detalhesProposta": None,
-                    "detalhesConsultor": None
+            if st.form_submit_button("Atualizar Atendimento"):
+                atendimento_atualizado = {
+                    "idChecagem": novo_idChecagem,
+                    "idNumPropostas": novo_idNumPropostas,
+                    "idRazaoSocial": novo_idRazaoSocial,
+                    "idEtapa": novo_idEtapa[0] if novo_idEtapa else None,
+                    "idObservacao": novo_idObservacao if novo_idObservacao else None,
+                    "idHoraVisita": novo_idHoraVisita,
+                    "idDataVisita": str(novo_idDataVisita),
+                    "idConsultor": novo_idConsultor,
+                    "idAtendNIF": novo_idAtendNIF,
+                    "idCNPJ": novo_idCNPJ,
+                    "idProduto": novo_idProduto,
+                    "idHoraAtend": novo_idHoraAtend if novo_idHoraAtend else None,
+                    "idData": str(novo_idData)
                 }
                 
-                # Buscar detalhes da proposta selecionada
-                if idNumPropostas:
-                    for proposta in db["propostas"]:
-                        if proposta["idNumPropostas"] == idNumPropostas:
-                            novo_atendimento["detalhesProposta"] = proposta
-                            break
-                
-                # Buscar detalhes do consultor selecionado
-                if idConsultor:
-                    for consultor in db["consultores"]:
-                        if consultor["id_consultores"] == idConsultor:
-                            novo_atendimento["detalhesConsultor"] = consultor
-                            break
-                
-                db["atendimentos"].append(novo_atendimento)
-                save_database(db)
-                st.success("Atendimento cadastrado com sucesso!")
-                st.balloons()
+                # Gravação pelo id estável, rejeitada se outra sessão alterou o atendimento nesse meio-tempo
+                if validate_form(db, "atendimentos", atendimento_atualizado, atual=atendimento["idAtendimento"]):
+                    try:
+                        update_record(
+                            db, "atendimentos", atendimento["idAtendimento"], atendimento_atualizado,
+                            versao_esperada=versao_lida
+                        )
+                    except VersionConflict:
+                        st.error("Este atendimento foi alterado por outro usuário. Recarregue a página e refaça a edição.")
+                    else:
+                        st.success("Atendimento atualizado com sucesso!")
+                        st.rerun()
+
+@page("Gerenciar Propostas")
+def render_propostas():
+    st.header("Propostas Comerciais")
     
-    elif menu_option == "Listar Atendimentos":
-        st.header("Lista de Atendimentos")
-        
-        # Filtros
-        col_filtro1, col_filtro2, col_filtro3 = st.columns(3)
-        with col_filtro1:
-            filtro_status = st.selectbox("Filtrar por Status", ["Todos", "Lançado", "Não Lançado"])
-        with col_filtro2:
-            filtro_consultor = st.selectbox(
-                "Filtrar por Consultor",
-                ["Todos"] + get_consultores(db)
-            )
-        with col_filtro3:
-            filtro_etapa = st.selectbox(
-                "Filtrar por Etapa",
-                ["Todos"] + [f"{e[0]} - {e[1]}" for e in get_etapas(db)]
-            )
-        
-        # Tabela de atendimentos
-        dados_tabela = []
-        for atendimento in db["atendimentos"]:
-            # Aplicar filtros
-            status_ok = (filtro_status == "Todos" or atendimento["idChecagem"] == filtro_status)
-            consultor_ok = (filtro_consultor == "Todos" or atendimento.get("idConsultor") == filtro_consultor)
-            
-            # Obter descrição da etapa para filtro
-            etapa_desc = ""
-            for etapa in db["etapas"]:
-                if etapa["id_etapa"] == atendimento.get("idEtapa"):
-                    etapa_desc = f"{etapa['id_etapa']} - {etapa['descricao']}"
-                    break
-            
-            etapa_ok = (filtro_etapa == "Todos" or etapa_desc == filtro_etapa)
+    db = load_database()
+    
+    tab1, tab2 = st.tabs(["Listar Propostas", "Nova Proposta"])
+    
+    with tab1:
+        if db["propostas"]:
+            busca = st.text_input("Buscar proposta", placeholder="Nº Proposta, Razão Social, CNPJ ou Produto")
+            if busca:
+                propostas_pagina, total = search_propostas(busca, limite=100)
+                st.caption(f"{total} resultados" + (" — mostrando os 100 mais relevantes" if total > 100 else ""))
+            else:
+                ordenar_por, crescente, pagina, tamanho = pagination_controls("propostas")
+                propostas_pagina = fetch_page(
+                    lambda p: page_propostas(ordenar_por=ordenar_por, crescente=crescente, pagina=p, tamanho=tamanho),
+                    pagina,
+                    tamanho
+                )
             
-            if status_ok and consultor_ok and etapa_ok:
-                dados_tabela.append([
-                    atendimento["idNumPropostas"],
-                    atendimento["idRazaoSocial"],
-                    atendimento["idCNPJ"],
-                    atendimento["idConsultor"],
-                    atendimento["idChecagem"],
-                    format_date(atendimento["idData"]),
-                    etapa_desc
-                ])
-        
-        if dados_tabela:
             st.dataframe(
-                dados_tabela,
+                propostas_pagina,
                 column_config={
-                    0: "Proposta",
-                    1: "Razão Social",
-                    2: "CNPJ",
-                    3: "Consultor",
-                    4: "Status",
-                    5: "Data",
-                    6: "Etapa"
+                    "idNumPropostas": "Nº Proposta",
+                    "idRazaoSocial": "Razão Social",
+                    "idCNPJ": "CNPJ",
+                    "idProduto": "Produto",
+                    "idHorasContratadas": "Horas Contratadas",
+                    "idData": "Data"
                 },
                 hide_index=True,
                 use_container_width=True
             )
         else:
-            st.warning("Nenhum atendimento encontrado com os filtros selecionados.")
+            st.info("Nenhuma proposta cadastrada.")
     
-    elif menu_option == "Editar Atendimento":
-        st.header("Editar Atendimento")
-        
-        if not db["atendimentos"]:
-            st.warning("Nenhum atendimento cadastrado para editar.")
-        else:
-            atendimentos_select = [f"{at['idNumPropostas']} - {at['idRazaoSocial']}" for at in db["atendimentos"]]
-            atendimento_selecionado = st.selectbox("Selecione o atendimento", atendimentos_select)
+    with tab2:
+        with st.form("form_proposta"):
+            col1, col2 = st.columns(2)
             
-            index_atendimento = atendimentos_select.index(atendimento_selecionado)
-            atendimento = db["atendimentos"][index_atendimento]
+            with col1:
+                idNumPropostas = st.text_input("Número da Proposta*")
+                idRazaoSocial = st.text_input("Razão Social*")
+                idCNPJ = st.text_input("CNPJ*")
+                
+            with col2:
+                idProduto = st.text_input("Produto*")
+                idHorasContratadas = st.number_input("Horas Contratadas", min_value=0)
+                idData = st.date_input("Data da Proposta", datetime.now())
             
-            with st.form("form_editar_atendimento"):
-                col1, col2 = st.columns(2)
+            if st.form_submit_button("Salvar Proposta"):
+                nova_proposta = {
+                    "idNumPropostas": idNumPropostas,
+                    "idRazaoSocial": idRazaoSocial,
+                    "idCNPJ": idCNPJ,
+                    "idProduto": idProduto,
+                    "idHorasContratadas": idHorasContratadas,
+                    "idData": str(idData)
+                }
                 
-                with col1:
-                    novo_idChecagem = st.selectbox(
-                        "Status", 
-                        ["Não Lançado", "Lançado"],
-                        index=0 if atendimento["idChecagem"] == "Não Lançado" else 1
-                    )
-                    
-                    # Combobox para Propostas
-                    propostas_disponiveis = get_propostas(db)
-                    novo_idNumPropostas = st.selectbox(
-                        "Nº Proposta",
-                        options=propostas_disponiveis,
-                        index=propostas_disponiveis.index(atendimento["idNumPropostas"]) if atendimento["idNumPropostas"] in propostas_disponiveis else 0
-                    )
-                    
-                    novo_idRazaoSocial = st.text_input("Razão Social", value=atendimento["idRazaoSocial"])
-                    
-                    # Combobox para Etapas
-                    etapas_disponiveis = get_etapas(db)
-                    etapa_atual = next((e for e in etapas_disponiveis if e[0] == atendimento["idEtapa"]), None)
-                    novo_idEtapa = st.selectbox(
-                        "Etapa",
-                        options=etapas_disponiveis,
-                        format_func=lambda x: f"{x[0]} - {x[1]}",
-                        index=etapas_disponiveis.index(etapa_atual) if etapa_atual in etapas_disponiveis else 0
-                    )
-                    
-                    novo_idObservacao = st.text_area(
-                        "Observações", 
-                        value=atendimento["idObservacao"] if atendimento["idObservacao"] else ""
-                    )
-                    
-                with col2:
-                    novo_idHoraVisita = st.text_input("Hora Visita", value=atendimento["idHoraVisita"])
-                    novo_idDataVisita = st.date_input(
-                        "Data Visita", 
-                        value=datetime.strptime(atendimento["idDataVisita"], "%Y-%m-%d") if atendimento["idDataVisita"] else datetime.now()
-                    )
-                    
-                    # Combobox para Consultores
-                    consultores_disponiveis = get_consultores(db)
-                    novo_idConsultor = st.selectbox(
-                        "Consultor",
-                        options=consultores_disponiveis,
-                        index=consultores_disponiveis.index(atendimento["idConsultor"]) if atendimento["idConsultor"] in consultores_disponiveis else 0
-                    )
-                    
-                    novo_idAtendNIF = st.text_input("NIF Atendimento", value=atendimento["idAtendNIF"])
-                    novo_idCNPJ = st.text_input("CNPJ", value=atendimento["idCNPJ"])
-                    novo_idProduto = st.text_input("Produto", value=atendimento["idProduto"])
-                    novo_idHoraAtend = st.text_input(
-                        "Hora Atendimento", 
-                        value=atendimento["idHoraAtend"] if atendimento["idHoraAtend"] else ""
-                    )
-                    novo_idData = st.date_input(
-                        "Data Atendimento", 
-                        value=datetime.strptime(atendimento["idData"], "%Y-%m-%d") if atendimento["idData"] else datetime.now()
-                    )
+                if validate_form(db, "propostas", nova_proposta):
+                    insert_record(db, "propostas", nova_proposta)
+                    st.success("Proposta cadastrada com sucesso!")
+                    st.balloons()
+
+@page("Gerenciar Consultores")
+def render_consultores():
+    st.header("Consultores")
+    
+    db = load_database()
+    
+    tab1, tab2 = st.tabs(["Listar Consultores", "Novo Consultor"])
+    
+    with tab1:
+        if db["consultores"]:
+            st.dataframe(
+                db["consultores"],
+                hide_index=True,
+                use_container_width=True
+            )
+        else:
+            st.info("Nenhum consultor cadastrado.")
+    
+    with tab2:
+        with st.form("form_consultor"):
+            id_consultores = st.text_input("Nome do Consultor*")
+            id_NIF = st.text_input("NIF do Consultor")
+            
+            if st.form_submit_button("Salvar Consultor"):
+                novo_consultor = {
+                    "id_consultores": id_consultores,
+                    "id_NIF": id_NIF if id_NIF else None
+                }
                 
-                if st.form_submit_button("Atualizar Atendimento"):
-                    atendimento_atualizado = {
-                        "idChecagem": novo_idChecagem,
-                        "idNumPropostas": novo_idNumPropostas,
-                        "idRazaoSocial": novo_idRazaoSocial,
-                        "idEtapa": novo_idEtapa[0] if novo_idEtapa else None,
-                        "idObservacao": novo_idObservacao if novo_idObservacao else None,
-                        "idHoraVisita": novo_idHoraVisita,
-                        "idDataVisita": str(novo_idDataVisita),
-                        "idConsultor": novo_idConsultor,
-                        "idAtendNIF": novo_idAtendNIF,
-                        "idCNPJ": novo_idCNPJ,
-                        "idProduto": novo_idProduto,
-                        "idHoraAtend": novo_idHoraAtend if novo_idHoraAtend else None,
-                        "idData": str(novo_idData),
-                        "detalhesProposta": None,
-                        "detalhesConsultor": None
-                    }
-                    
-                    # Atualizar relacionamentos
-                    if novo_idNumPropostas:
-                        for proposta in db["propostas"]:
-                            if proposta["idNumPropostas"] == novo_idNumPropostas:
-                                atendimento_atualizado["detalhesProposta"] = proposta
-                                break
-                    
-                    if novo_idConsultor:
-                        for consultor in db["consultores"]:
-                            if consultor["id_consultores"] == novo_idConsultor:
-                                atendimento_atualizado["detalhesConsultor"] = consultor
-                                break
-                    
-                    db["atendimentos"][index_atendimento] = atendimento_atualizado
-                    save_database(db)
-                    st.success("Atendimento atualizado com sucesso!")
-                    st.rerun()
-    
-    elif menu_option == "Gerenciar Propostas":
-        st.header("Propostas Comerciais")
-        
-        tab1, tab2 = st.tabs(["Listar Propostas", "Nova Proposta"])
-        
-        with tab1:
-            if db["propostas"]:
-                dados_tabela = []
-                for proposta in db["propostas"]:
-                    dados_tabela.append([
-                        proposta["idNumPropostas"],
-                        proposta["idRazaoSocial"],
-                        proposta["idCNPJ"],
-                        proposta["idProduto"],
-                        proposta["idHorasContratadas"],
-                        format_date(proposta["idData"])
-                    ])
+                if validate_form(db, "consultores", novo_consultor):
+                    insert_record(db, "consultores", novo_consultor)
+                    st.success("Consultor cadastrado com sucesso!")
+                    st.balloons()
+
+@page("Gerenciar Etapas")
+def render_etapas():
+    st.header("Gestão de Etapas")
+    
+    db = load_database()
+    
+    tab1, tab2 = st.tabs(["Listar Etapas", "Nova Etapa"])
+    
+    with tab1:
+        if db["etapas"]:
+            st.dataframe(
+                db["etapas"],
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "id_etapa": "Código",
+                    "descricao": "Descrição"
+                }
+            )
+        else:
+            st.info("Nenhuma etapa cadastrada.")
+    
+    with tab2:
+        with st.form("form_etapa"):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                id_etapa = st.text_input("Código da Etapa* (Ex: 1, 2, 3...)")
+            with col2:
+                descricao = st.text_input("Descrição da Etapa*")
+            
+            if st.form_submit_button("Salvar Etapa"):
+                nova_etapa = {
+                    "id_etapa": id_etapa,
+                    "descricao": descricao
+                }
                 
-                st.dataframe(
-                    dados_tabela,
-                    column_config={
-                        0: "Nº Proposta",
-                        1: "Razão Social",
-                        2: "CNPJ",
-                        3: "Produto",
-                        4: "Horas Contratadas",
-                        5: "Data"
-                    },
-                    hide_index=True,
-                    use_container_width=True
-                )
+                if validate_form(db, "etapas", nova_etapa):
+                    insert_record(db, "etapas", nova_etapa)
+                    st.success("Etapa cadastrada com sucesso!")
+                    st.balloons()
+
+@page("Importar Dados")
+def render_importar():
+    from importer import import_file
+    
+    st.header("Importação de Dados")
+    
+    colecao = st.selectbox("Coleção", ["atendimentos", "propostas"], key="importar_colecao")
+    arquivo = st.file_uploader("Arquivo CSV ou XLSX", type=["csv", "xlsx"])
+    st.caption(
+        "A primeira linha deve trazer os cabeçalhos (nomes dos campos ou rótulos do formulário). "
+        "Datas em AAAA-MM-DD ou DD/MM/AAAA."
+    )
+    parcial = st.checkbox("Importar somente as linhas válidas", help="Sem esta opção, nada é gravado se houver erros")
+    
+    if arquivo is not None and st.button("Importar"):
+        try:
+            resultado = import_file(colecao, arquivo, arquivo.name, parcial)
+        except ImportError:
+            st.error("A leitura de arquivos XLSX requer o pacote openpyxl.")
+        else:
+            if resultado["importados"]:
+                st.success(f"{resultado['importados']} {colecao} importados com sucesso!")
+            elif resultado["erros"]:
+                st.error(f"Nada foi importado: {len(resultado['erros'])} erros encontrados.")
             else:
-                st.info("Nenhuma proposta cadastrada.")
-        
-        with tab2:
-            with st.form("form_proposta"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    idNumPropostas = st.text_input("Número da Proposta*")
-                    idRazaoSocial = st.text_input("Razão Social*")
-                    idCNPJ = st.text_input("CNPJ*")
-                    
-                with col2:
-                    idProduto = st.text_input("Produto*")
-                    idHorasContratadas = st.number_input("Horas Contratadas", min_value=0)
-                    idData = st.date_input("Data da Proposta", datetime.now())
-                
-                if st.form_submit_button("Salvar Proposta"):
-                    if not idNumPropostas or not idRazaoSocial or not idCNPJ or not idProduto:
-                        st.error("Campos marcados com * são obrigatórios!")
-                    else:
-                        nova_proposta = {
-                            "idNumPropostas": idNumPropostas,
-                            "idRazaoSocial": idRazaoSocial,
-                            "idCNPJ": idCNPJ,
-                            "idProduto": idProduto,
-                            "idHorasContratadas": idHorasContratadas,
-                            "idData": str(idData)
-                        }
-                        
-                        # Atualizar atendimentos relacionados
-                        for atendimento in db["atendimentos"]:
-                            if atendimento["idNumPropostas"] == idNumPropostas:
-                                atendimento["detalhesProposta"] = nova_proposta
-                        
-                        db["propostas"].append(nova_proposta)
-                        save_database(db)
-                        st.success("Proposta cadastrada com sucesso!")
-                        st.balloons()
-    
-    elif menu_option == "Gerenciar Consultores":
-        st.header("Consultores")
-        
-        tab1, tab2 = st.tabs(["Listar Consultores", "Novo Consultor"])
-        
-        with tab1:
-            if db["consultores"]:
+                st.warning("Nenhuma linha encontrada no arquivo.")
+            if resultado["erros"]:
                 st.dataframe(
-                    db["consultores"],
+                    [{"Linha": linha, "Erro": erro} for linha, erro in resultado["erros"]],
                     hide_index=True,
                     use_container_width=True
                 )
-            else:
-                st.info("Nenhum consultor cadastrado.")
-        
-        with tab2:
-            with st.form("form_consultor"):
-                id_consultores = st.text_input("Nome do Consultor*")
-                id_NIF = st.text_input("NIF do Consultor")
-                
-                if st.form_submit_button("Salvar Consultor"):
-                    if not id_consultores:
-                        st.error("O nome do consultor é obrigatório!")
-                    else:
-                        novo_consultor = {
-                            "id_consultores": id_consultores,
-                            "id_NIF": id_NIF if id_NIF else None
-                        }
-                        
-                        # Atualizar atendimentos relacionados
-                        for atendimento in db["atendimentos"]:
-                            if atendimento["idConsultor"] == id_consultores:
-                                atendimento["detalhesConsultor"] = novo_consultor
-                        
-                        db["consultores"].append(novo_consultor)
-                        save_database(db)
-                        st.success("Consultor cadastrado com sucesso!")
-                        st.balloons()
-    
-    elif menu_option == "Gerenciar Etapas":
-        st.header("Gestão de Etapas")
-        
-        tab1, tab2 = st.tabs(["Listar Etapas", "Nova Etapa"])
-        
-        with tab1:
-            if db["etapas"]:
-                st.dataframe(
-                    db["etapas"],
-                    hide_index=True,
-                    use_container_width=True,
-                    column_config={
-                        "id_etapa": "Código",
-                        "descricao": "Descrição"
-                    }
-                )
-            else:
-                st.info("Nenhuma etapa cadastrada.")
-        
-        with tab2:
-            with st.form("form_etapa"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    id_etapa = st.text_input("Código da Etapa* (Ex: 1, 2, 3...)")
-                with col2:
-                    descricao = st.text_input("Descrição da Etapa*")
-                
-                if st.form_submit_button("Salvar Etapa"):
-                    if not id_etapa or not descricao:
-                        st.error("Todos os campos são obrigatórios!")
-                    elif any(e["id_etapa"] == id_etapa for e in db["etapas"]):
-                        st.error("Já existe uma etapa com este código!")
-                    else:
-                        nova_etapa = {
-                            "id_etapa": id_etapa,
-                            "descricao": descricao
-                        }
-                        
-                        db["etapas"].append(nova_etapa)
-                        save_database(db)
-                        st.success("Etapa cadastrada com sucesso!")
-                        st.balloons()
-    
-    elif menu_option == "Exportar Dados":
-        st.header("Exportação de Dados")
-        
-        st.download_button(
-            label="Baixar Banco de Dados Completo",
-            data=json.dumps(db, ensure_ascii=False, indent=4),
-            file_name="database_export.json",
-            mime="application/json"
+
+@page("Exportar Dados")
+def render_exportar():
+    from export import FORMATOS, COMPRESSOES, export_bytes, file_name, mime_type
+    
+    st.header("Exportação de Dados")
+    
+    db = load_database()
+    opcoes = get_options()
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        formato = st.selectbox("Formato", list(FORMATOS), format_func=FORMATOS.get)
+    with col2:
+        colecao = st.selectbox(
+            "Coleção",
+            ["atendimentos", "propostas", "consultores", "etapas"],
+            disabled=formato == "json",
+            help="O JSON completo traz todas as coleções"
         )
-        
-        st.divider()
-        st.subheader("Estatísticas")
-        col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Total Atendimentos", len(db["atendimentos"]))
-        col2.metric("Total Propostas", len(db["propostas"]))
-        col3.metric("Total Consultores", len(db["consultores"]))
-        col4.metric("Total Etapas", len(db["etapas"]))
+    with col3:
+        compressao = st.selectbox("Compressão", COMPRESSOES)
+    
+    with st.expander("Filtros de atendimentos"):
+        periodo = st.date_input("Período (Data Atendimento)", value=(), format="DD/MM/YYYY")
+        col1, col2 = st.columns(2)
+        with col1:
+            filtro_consultor = st.selectbox("Consultor", ["Todos"] + opcoes["consultores"], key="exportar_consultor")
+        with col2:
+            filtro_status = st.selectbox("Status", ["Todos", "Lançado", "Não Lançado"], key="exportar_status")
+    
+    filtros = {
+        "desde": str(periodo[0]) if len(periodo) > 0 else None,
+        "ate": str(periodo[1]) if len(periodo) > 1 else None,
+        "consultor": None if filtro_consultor == "Todos" else filtro_consultor,
+        "status": None if filtro_status == "Todos" else filtro_status
+    }
+    
+    # O arquivo só é gerado (em blocos, num temporário) quando o usuário clica no botão
+    st.download_button(
+        label="Baixar Exportação",
+        data=lambda: export_bytes(db, formato, colecao, compressao, arquivo=get_archive(), **filtros),
+        file_name=file_name(formato, colecao, compressao),
+        mime=mime_type(formato, compressao)
+    )
+    
+    st.divider()
+    st.subheader("Estatísticas")
+    # Contadores mantidos a cada gravação, somados aos do arquivo (guardados no manifesto):
+    # nada aqui percorre os atendimentos
+    arquivo = get_archive()
+    agregados = get_aggregates(db).merged(arquivo.aggregates())
+    estado = agregados.state()
+    if arquivo.total():
+        st.caption(f"Inclui {arquivo.total()} atendimentos arquivados")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total Atendimentos", agregados.total("atendimentos"))
+    col2.metric("Total Propostas", agregados.total("propostas"))
+    col3.metric("Total Consultores", agregados.total("consultores"))
+    col4.metric("Total Etapas", agregados.total("etapas"))
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Atendimentos por Consultor**")
+        st.bar_chart({consultor or "(sem consultor)": total for consultor, total in estado["consultor"].items()})
+    with col2:
+        st.markdown("**Atendimentos por Etapa**")
+        indices = get_indexes(db)
+        st.bar_chart({indices.etapa_desc(etapa) or etapa or "(sem etapa)": total for etapa, total in estado["etapa"].items()})
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        st.markdown("**Atendimentos por Mês**")
+        st.bar_chart(dict(sorted((mes, total) for mes, total in estado["mes"].items() if mes)))
+    with col2:
+        st.markdown("**Atendimentos por Status**")
+        st.dataframe(
+            [{"Status": status, "Atendimentos": total} for status, total in estado["status"].items()],
+            hide_index=True,
+            use_container_width=True
+        )
+    
+    st.markdown("**Consumo das Propostas**")
+    st.dataframe(
+        agregados.consumption(),
+        column_config={
+            "idNumPropostas": "Nº Proposta",
+            "idHorasContratadas": "Horas Contratadas",
+            "atendimentos": "Atendimentos"
+        },
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    cache = cache_stats()
+    st.caption(f"Cache do banco: {cache['hits']} leituras em cache, {cache['misses']} recargas do disco (versão {cache['versao']})")
+    espera = lock_stats()
+    st.caption(
+        f"Gravações: {espera['gravacoes']}, espera total pelo lock {espera['segundos']:.3f}s "
+        f"(máxima {espera['maximo']:.3f}s)"
+    )
+
+@page("Diagnóstico")
+def render_diagnostico():
+    from profiling import stats, prometheus_text, reset
+    
+    st.header("Diagnóstico")
+    
+    st.subheader("Tempos por trecho (este processo)")
+    st.dataframe(
+        [
+            {
+                "Trecho": nome,
+                "Execuções": e["contagem"],
+                "p50 (ms)": round(e["p50"] * 1000, 2),
+                "p95 (ms)": round(e["p95"] * 1000, 2),
+                "p99 (ms)": round(e["p99"] * 1000, 2),
+                "Total (s)": round(e["soma"], 3),
+                "Bytes lidos": e["bytes_lidos"],
+                "Bytes gravados": e["bytes_gravados"]
+            }
+            for nome, e in stats().items()
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    cache = cache_stats()
+    espera = lock_stats()
+    st.caption(
+        f"Cache do banco: {cache['hits']} leituras em cache, {cache['misses']} recargas do disco. "
+        f"Gravações: {espera['gravacoes']}, espera total pelo lock {espera['segundos']:.3f}s"
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Baixar métricas (Prometheus)", data=prometheus_text(), file_name="metrics.prom", mime="text/plain")
+    with col2:
+        if st.button("Zerar estatísticas"):
+            reset()
+            st.rerun()
+    
+    st.subheader("Perfil de uma execução")
+    st.caption("Ative a captura e interaja com a página a ser analisada: a próxima execução de uma página roda sob o cProfile.")
+    if st.button("Capturar perfil da próxima execução"):
+        st.session_state["capturar_perfil"] = True
+        st.info("Captura ativada.")
+    
+    perfil = st.session_state.get("perfil")
+    if perfil:
+        st.download_button("Baixar perfil (.prof)", data=perfil["prof"], file_name="perfil.prof", mime="application/octet-stream")
+        with st.expander("Relatório (tempo acumulado)"):
+            st.code(perfil["texto"])
+
+# Interface Streamlit
+def main():
+    st.title("📋 Sistema de Gerenciamento de Atendimentos")
+    
+    # Menu lateral
+    menu_option = st.sidebar.selectbox(
+        "Menu Principal",
+        PAGINAS + (["Diagnóstico"] if is_admin() else []),
+        key="menu"
+    )
+    
+    RENDERIZADORES[menu_option]()
+
+# Cada execução completa do script é medida (as das páginas, inclusive as reexecuções dos
+# fragmentos, em page())
+def run():
+    with span("app.run"):
+        main()
 
 if __name__ == "__main__":
-    main()
+    run()
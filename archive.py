@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from aggregates import Aggregates
+from profiling import record_bytes, span
+from records import Atendimento, json_default
+
+# Meses mantidos no banco ativo: atendimentos encerrados mais antigos que isso podem ser arquivados
+HOT_MONTHS = int(os.environ.get("JTD_HOT_MONTHS", 6))
+# Partições (meses) arquivadas mantidas em memória depois de lidas
+PARTICOES_EM_CACHE = 12
+
+def month_of(atendimento):
+    return str(atendimento.get("idData") or "")[:7]
+
+# Primeiro mês (AAAA-MM) da janela ativa de `meses` meses que termina no mês de `hoje`
+def cutoff_month(meses=HOT_MONTHS, hoje=None):
+    hoje = hoje or date.today()
+    total = hoje.year * 12 + hoje.month - 1 - (meses - 1)
+    return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+# Identifica a versão de um arquivo do arquivo frio (as gravações trocam o arquivo inteiro: novo inode)
+def _assinatura(arquivo):
+    try:
+        info = os.stat(arquivo)
+    except FileNotFoundError:
+        return None
+    return (info.st_mtime_ns, info.st_ino, info.st_size)
+
+# Arquivo frio dos atendimentos: um arquivo JSON por mês de idData numa pasta ao lado do banco
+# (<banco>.arquivo/AAAA-MM.json) e um manifesto com a contagem de cada mês e as estatísticas
+# dos registros arquivados. As partições só são lidas quando uma consulta pede o período
+class Archive:
+    def __init__(self, path):
+        self.pasta = path + ".arquivo"
+        self._lock = threading.Lock()
+        self._particoes = OrderedDict()
+        self._manifesto = None
+
+    def _manifest_file(self):
+        return os.path.join(self.pasta, "manifesto.json")
+
+    def _month_file(self, mes):
+        return os.path.join(self.pasta, f"{mes or 'sem-data'}.json")
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_file(), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"meses": {}, "agregados": {}}
+
+    # Manifesto em cache enquanto o arquivo não mudar (somente leitura: quem grava usa _read_manifest)
+    def manifest(self):
+        assinatura = _assinatura(self._manifest_file())
+        with self._lock:
+            if self._manifesto is not None and self._manifesto[0] == assinatura:
+                return self._manifesto[1]
+        manifesto = self._read_manifest()
+        with self._lock:
+            self._manifesto = (assinatura, manifesto)
+        return manifesto
+
+    def months(self):
+        return sorted(self.manifest()["meses"])
+
+    def total(self):
+        return sum(self.manifest()["meses"].values())
+
+    def aggregates(self):
+        return Aggregates(estado=self.manifest()["agregados"])
+
+    # Registros de um mês; a partição lida fica em cache enquanto o arquivo não mudar
+    def load_month(self, mes):
+        arquivo = self._month_file(mes)
+        assinatura = _assinatura(arquivo)
+        if assinatura is None:
+            return []
+        with self._lock:
+            em_cache = self._particoes.get(mes)
+            if em_cache and em_cache[0] == assinatura:
+                self._particoes.move_to_end(mes)
+                return em_cache[1]
+        with span("archive.load_month"), open(arquivo, "rb") as f:
+            conteudo = f.read()
+            registros = [Atendimento(atendimento) for atendimento in json.loads(conteudo)]
+        record_bytes("archive.load_month", lidos=len(conteudo))
+        with self._lock:
+            self._particoes[mes] = (assinatura, registros)
+            self._particoes.move_to_end(mes)
+            while len(self._particoes) > PARTICOES_EM_CACHE:
+                self._particoes.popitem(last=False)
+        return registros
+
+    # Atendimentos arquivados com idData entre desde e ate (AAAA-MM-DD, None = sem limite);
+    # só as partições dos meses do período são lidas
+    def iter_range(self, desde=None, ate=None):
+        for mes in self.months():
+            if desde and mes < desde[:7]:
+                continue
+            if ate and mes > ate[:7]:
+                continue
+            for atendimento in self.load_month(mes):
+                data = str(atendimento.get("idData") or "")[:10]
+                if desde and data < desde:
+                    continue
+                if ate and data > ate:
+                    continue
+                yield atendimento
+
+    # Acrescenta os atendimentos às partições dos seus meses. Registros já arquivados (mesmo
+    # idAtendimento) são ignorados, então repetir um arquivamento interrompido é seguro.
+    # Chamado com o lock exclusivo do banco
+    def add(self, atendimentos):
+        from storage import atomic_write
+        os.makedirs(self.pasta, exist_ok=True)
+        manifesto = self._read_manifest()
+        agregados = Aggregates(estado=manifesto["agregados"])
+        por_mes = {}
+        for atendimento in atendimentos:
+            por_mes.setdefault(month_of(atendimento), []).append(atendimento)
+        novos = 0
+        for mes, registros in por_mes.items():
+            existentes = list(self.load_month(mes))
+            ids = {atendimento.get("idAtendimento") for atendimento in existentes}
+            for atendimento in registros:
+                if atendimento.get("idAtendimento") not in ids:
+                    existentes.append(atendimento)
+                    agregados.add("atendimentos", atendimento)
+                    novos += 1
+            atomic_write(self._month_file(mes), lambda f: json.dump(existentes, f, ensure_ascii=False, default=json_default))
+            manifesto["meses"][mes] = len(existentes)
+        manifesto["agregados"] = agregados.state()
+        atomic_write(self._manifest_file(), lambda f: json.dump(manifesto, f, ensure_ascii=False, indent=4))
+        return novos
+
+    # Recalcula as estatísticas do arquivo lendo todas as partições
+    def rebuild_aggregates(self):
+        from storage import atomic_write
+        if not os.path.isdir(self.pasta):
+            return
+        manifesto = self._read_manifest()
+        agregados = Aggregates()
+        for mes in self.months():
+            registros = self.load_month(mes)
+            manifesto["meses"][mes] = len(registros)
+            for atendimento in registros:
+                agregados.add("atendimentos", atendimento)
+        manifesto["agregados"] = agregados.state()
+        atomic_write(self._manifest_file(), lambda f: json.dump(manifesto, f, ensure_ascii=False, indent=4))
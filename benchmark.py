@@ -0,0 +1,267 @@
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import storage
+
+# Benchmark dos caminhos de carga, gravação, listagem, edição e exportação (python benchmark.py --help).
+# Os bancos são sintéticos, no formato gravado pelo app (inclusive as cópias detalhes* de versões antigas),
+# e os resultados são acrescentados a um arquivo JSON lines para comparar versões
+
+NOMES = ["São João", "Boa Vista", "Três Irmãos", "Nossa Senhora", "Santa Luzia", "Bom Jesus", "Vale Verde",
+         "Ouro Preto", "Campo Belo", "Água Limpa", "Pôr do Sol", "Estrela", "Aliança", "União", "Progresso"]
+RAMOS = ["Padaria", "Açougue", "Confecções", "Metalúrgica", "Comércio de Alimentos", "Ótica", "Construções",
+         "Transportes", "Cosméticos", "Móveis", "Laticínios", "Serviços Contábeis", "Café", "Cerâmica"]
+SUFIXOS = ["Ltda", "ME", "EIRELI", "S/A", "EPP"]
+PRODUTOS = ["Marketing Digital", "Gestão Financeira", "Design de Embalagem", "Adequação à LGPD",
+            "Eficiência Energética", "Boas Práticas de Fabricação", "Gestão da Qualidade", "Identidade Visual"]
+ETAPAS = ["Primeiro Contato", "Análise de Necessidades", "Proposta Enviada", "Fechamento", "Diagnóstico",
+          "Plano de Ação", "Execução", "Entrega Final", "Avaliação", "Encerramento"]
+OBSERVACOES = [None, None, "Cliente pediu retorno na próxima semana", "Reunião remarcada",
+               "Aguardando documentação", "Visita técnica realizada", "Empresário ausente, falar com gerente"]
+
+TAMANHOS = [1000, 10000, 100000]
+RESULTADOS = os.path.join("benchmarks", "resultados.jsonl")
+
+def _cnpj(aleatorio):
+    n = f"{aleatorio.randrange(10 ** 12):012d}"
+    return f"{n[:2]}.{n[2:5]}.{n[5:8]}/{n[8:12]}-{aleatorio.randrange(100):02d}"
+
+def _data(aleatorio, inicio, dias):
+    return (inicio + timedelta(days=aleatorio.randrange(dias))).isoformat()
+
+# Banco sintético; por padrão uma proposta para cada 10 atendimentos e um consultor para cada 500
+def generate_database(atendimentos, propostas=None, consultores=None, etapas=4, detalhes=True, semente=1):
+    aleatorio = random.Random(semente)
+    propostas = propostas or max(1, atendimentos // 10)
+    consultores = consultores or max(3, atendimentos // 500)
+    inicio = date(2018, 1, 1)
+    dias = (date(2025, 12, 31) - inicio).days
+    db = {
+        "atendimentos": [],
+        "consultores": [
+            {"id_consultores": f"Consultor {i + 1:04d}", "id_NIF": f"{aleatorio.randrange(10 ** 8):08d}"}
+            for i in range(consultores)
+        ],
+        "etapas": [{"id_etapa": str(i + 1), "descricao": ETAPAS[i % len(ETAPAS)]} for i in range(etapas)],
+        "propostas": []
+    }
+    for i in range(propostas):
+        db["propostas"].append({
+            "idNumPropostas": f"{2018 + i % 8}{i + 1:07d}",
+            "idRazaoSocial": f"{aleatorio.choice(RAMOS)} {aleatorio.choice(NOMES)} {aleatorio.choice(SUFIXOS)}",
+            "idCNPJ": _cnpj(aleatorio),
+            "idProduto": aleatorio.choice(PRODUTOS),
+            "idHorasContratadas": aleatorio.choice([8, 16, 20, 40, 80]),
+            "idData": _data(aleatorio, inicio, dias)
+        })
+    for i in range(atendimentos):
+        proposta = aleatorio.choice(db["propostas"])
+        consultor = aleatorio.choice(db["consultores"])
+        atendimento = {
+            "idChecagem": aleatorio.choice(["Não Lançado", "Lançado"]),
+            "idNumPropostas": proposta["idNumPropostas"],
+            "idRazaoSocial": proposta["idRazaoSocial"],
+            "idEtapa": aleatorio.choice(db["etapas"])["id_etapa"],
+            "idObservacao": aleatorio.choice(OBSERVACOES),
+            "idHoraVisita": f"{aleatorio.randrange(8, 18):02d}:00",
+            "idDataVisita": _data(aleatorio, inicio, dias),
+            "idConsultor": consultor["id_consultores"],
+            "idAtendNIF": consultor["id_NIF"],
+            "idCNPJ": proposta["idCNPJ"],
+            "idProduto": proposta["idProduto"],
+            "idHoraAtend": aleatorio.choice([None, "1", "2", "4"]),
+            "idData": _data(aleatorio, inicio, dias)
+        }
+        if detalhes:
+            atendimento["detalhesProposta"] = proposta
+            atendimento["detalhesConsultor"] = consultor
+        db["atendimentos"].append(atendimento)
+    return db
+
+def write_database(db, path):
+    if path.endswith(storage.SQLITE_EXTENSIONS):
+        from sqlite_storage import SqliteStorage
+        SqliteStorage(path).save_database(db)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(db, f, ensure_ascii=False, indent=4)
+
+def _percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    return ordenadas[max(0, math.ceil(p / 100 * len(ordenadas)) - 1)]
+
+# Executa a operação (depois de uma execução de aquecimento) e mede latências, o pico de memória e a
+# memória retida pelo que ela devolve (o banco carregado, no load_database, sem os derivados construídos depois)
+def measure(operacao, repeticoes):
+    operacao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        operacao()
+        tempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    try:
+        retorno = operacao()
+        retida, pico = tracemalloc.get_traced_memory()
+        del retorno
+    finally:
+        tracemalloc.stop()
+    return {
+        "p50": _percentil(tempos, 50),
+        "p95": _percentil(tempos, 95),
+        "p99": _percentil(tempos, 99),
+        "max": max(tempos),
+        "pico_memoria": pico,
+        "memoria_retida": retida
+    }
+
+# Páginas do app executadas sem navegador pelo AppTest do Streamlit
+def run_page(pagina, preparar=None):
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"), default_timeout=600)
+    app.run()
+    app.sidebar.selectbox[0].select(pagina).run()
+    if preparar:
+        preparar(app)
+    if app.exception:
+        raise RuntimeError(f"{pagina}: {app.exception}")
+
+def operations(path, db, com_app=True):
+    from export import iter_export
+    from frames import CollectionFrame
+    from search import SearchIndex
+    backend = storage.get_storage(path)
+    consultor = db["consultores"][0]["id_consultores"]
+    busca = db["atendimentos"][len(db["atendimentos"]) // 2]["idRazaoSocial"].split()[0]
+
+    def load():
+        # Cada carga usa uma instância nova: mede a leitura do disco, não o cache do processo
+        return type(backend)(path).load_database()
+
+    def listar():
+        backend.page_atendimentos(status="Lançado", consultor=consultor, ordenar_por="idData", pagina=1, tamanho=50)
+
+    def editar():
+        atual = backend.load_database()
+        posicoes = backend.get_search(atual).search(busca, limite=50)
+        for pos in posicoes:
+            backend.find_atendimento(atual, atual["atendimentos"][pos]["idAtendimento"])
+
+    def exportar():
+        for _ in iter_export(backend.load_database(), "json"):
+            pass
+
+    def inserir():
+        backend.insert_record(backend.load_database(), "consultores", {"id_consultores": "Benchmark", "id_NIF": None})
+
+    operacoes = {
+        "load_database": load,
+        "save_database": lambda: backend.save_database(backend.load_database()),
+        "insert_record": inserir,
+        "listar_tabela": lambda: CollectionFrame(backend.load_database()),
+        "listar": listar,
+        "indice_busca": lambda: SearchIndex(backend.load_database()),
+        "editar_seletor": editar,
+        "exportar_json": exportar
+    }
+    if com_app:
+        operacoes["app_listar"] = lambda: run_page("Listar Atendimentos")
+        operacoes["app_editar"] = lambda: run_page(
+            "Editar Atendimento", lambda app: app.text_input[0].input(busca).run()
+        )
+    return operacoes
+
+def git_version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecida"
+
+def load_results(arquivo):
+    if not os.path.exists(arquivo):
+        return []
+    with open(arquivo, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+def save_results(arquivo, resultados):
+    os.makedirs(os.path.dirname(arquivo) or ".", exist_ok=True)
+    with open(arquivo, "a", encoding="utf-8") as f:
+        for resultado in resultados:
+            f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+
+# Último resultado de outra versão para a mesma combinação de backend, tamanho e operação
+def previous_result(anteriores, resultado):
+    for anterior in reversed(anteriores):
+        if (anterior["versao"] != resultado["versao"] and anterior["backend"] == resultado["backend"]
+                and anterior["atendimentos"] == resultado["atendimentos"] and anterior["operacao"] == resultado["operacao"]):
+            return anterior
+    return None
+
+def print_result(resultado, anterior):
+    linha = (
+        f"{resultado['backend']:6} {resultado['atendimentos']:>9} {resultado['operacao']:15} "
+        f"p50 {resultado['p50'] * 1000:10.2f}ms  p95 {resultado['p95'] * 1000:10.2f}ms  "
+        f"p99 {resultado['p99'] * 1000:10.2f}ms  memória {resultado['pico_memoria'] / 2 ** 20:8.1f}MiB"
+    )
+    if resultado["operacao"] == "load_database":
+        linha += f"  {resultado['memoria_retida'] / resultado['atendimentos']:7.0f}B/atendimento"
+    if anterior:
+        linha += f"  ({resultado['p50'] / anterior['p50']:.2f}x p50 de {anterior['versao']})"
+    print(linha, flush=True)
+
+def run(tamanhos, backend="json", repeticoes=5, com_app=True, detalhes=True, arquivo=RESULTADOS):
+    anteriores = load_results(arquivo)
+    versao = git_version()
+    resultados = []
+    with tempfile.TemporaryDirectory() as pasta:
+        for tamanho in tamanhos:
+            path = os.path.join(pasta, f"bench{tamanho}." + ("db" if backend == "sqlite" else "json"))
+            write_database(generate_database(tamanho, detalhes=detalhes), path)
+            # As páginas do app usam o banco padrão do módulo storage
+            storage.DB_FILE = path
+            db = storage.get_storage(path).load_database()
+            for nome, operacao in operations(path, db, com_app).items():
+                resultado = dict(
+                    measure(operacao, repeticoes),
+                    versao=versao,
+                    data=datetime.now().isoformat(timespec="seconds"),
+                    backend=backend,
+                    atendimentos=tamanho,
+                    operacao=nome,
+                    repeticoes=repeticoes
+                )
+                print_result(resultado, previous_result(anteriores, resultado))
+                resultados.append(resultado)
+            storage._storages.pop(path, None)
+    save_results(arquivo, resultados)
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do Sistema de Atendimentos com bancos sintéticos")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS, help="Quantidades de atendimentos (padrão: %(default)s)")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--sem-app", action="store_true", help="Não executa as páginas pelo AppTest")
+    parser.add_argument("--sem-detalhes", action="store_true", help="Gera atendimentos sem as cópias detalhes*")
+    parser.add_argument("--resultados", default=RESULTADOS, help="Arquivo JSON lines de resultados (padrão: %(default)s)")
+    parser.add_argument("--gerar", metavar="ARQUIVO", help="Só grava um banco sintético com o primeiro tamanho e sai")
+    args = parser.parse_args()
+    if args.gerar:
+        write_database(generate_database(args.tamanhos[0], detalhes=not args.sem_detalhes), args.gerar)
+        print(f"Banco sintético com {args.tamanhos[0]} atendimentos gravado em {args.gerar}")
+        return
+    run(args.tamanhos, args.backend, args.repeticoes, not args.sem_app, not args.sem_detalhes, args.resultados)
+
+if __name__ == "__main__":
+    main()
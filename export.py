@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+import tempfile
+import textwrap
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from profiling import record_bytes, span
+from storage import CAMPOS, find_atendimento, get_indexes
+
+# Formatos e compressões oferecidos na exportação
+FORMATOS = {"json": "JSON completo", "ndjson": "NDJSON", "csv": "CSV"}
+COMPRESSOES = ["nenhuma", "gzip"] + (["zstd"] if zstandard else [])
+EXTENSOES = {"json": "json", "ndjson": "ndjson", "csv": "csv", "gzip": ".gz", "zstd": ".zst"}
+MIMES = {"json": "application/json", "ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+CHUNK_SIZE = 64 * 1024
+
+def _data(valor):
+    if valor and "T" in valor:
+        return valor.split("T")[0]
+    return valor
+
+def _passa(atendimento, desde, ate, consultor, status):
+    data = _data(atendimento.get("idData")) or ""
+    if desde and data < desde:
+        return False
+    if ate and data > ate:
+        return False
+    if consultor is not None and atendimento.get("idConsultor") != consultor:
+        return False
+    if status is not None and atendimento.get("idChecagem") != status:
+        return False
+    return True
+
+# Filtros da exportação de atendimentos; desde/ate são datas ISO (AAAA-MM-DD), None significa sem filtro.
+# Com o arquivo, os atendimentos arquivados do período vêm antes dos do banco ativo (só as partições
+# dos meses pedidos são lidas); os que também estão no banco ativo ficam só com a versão dele
+def iter_atendimentos(db, desde=None, ate=None, consultor=None, status=None, arquivo=None):
+    indices = get_indexes(db)
+    if arquivo is not None:
+        for atendimento in arquivo.iter_range(desde, ate):
+            if _passa(atendimento, desde, ate, consultor, status) and find_atendimento(db, atendimento.get("idAtendimento")) is None:
+                yield indices.resolve(atendimento)
+    for atendimento in db["atendimentos"]:
+        if _passa(atendimento, desde, ate, consultor, status):
+            yield indices.resolve(atendimento)
+
+def iter_records(db, colecao, **filtros):
+    if colecao == "atendimentos":
+        return iter_atendimentos(db, **filtros)
+    return iter(db[colecao])
+
+# Mesmo conteúdo de json.dumps(export_database(db), indent=4), gerado registro a registro
+def iter_json(db, **filtros):
+    yield "{"
+    for i, colecao in enumerate(db):
+        yield ("," if i else "") + f"\n    {json.dumps(colecao)}: ["
+        vazio = True
+        for registro in iter_records(db, colecao, **filtros):
+            texto = textwrap.indent(json.dumps(registro, ensure_ascii=False, indent=4), " " * 8)
+            yield ("\n" if vazio else ",\n") + texto
+            vazio = False
+        yield "]" if vazio else "\n    ]"
+    yield "\n}"
+
+def iter_ndjson(db, colecao, **filtros):
+    for registro in iter_records(db, colecao, **filtros):
+        yield json.dumps(registro, ensure_ascii=False) + "\n"
+
+# CSV com os campos da coleção; os detalhes aninhados dos atendimentos ficam de fora
+def iter_csv(db, colecao, **filtros):
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=CAMPOS[colecao], extrasaction="ignore")
+    escritor.writeheader()
+    for registro in iter_records(db, colecao, **filtros):
+        escritor.writerow(registro)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+# Agrupa os pedaços de texto em blocos de bytes de ~CHUNK_SIZE, comprimindo em fluxo se pedido
+def iter_bytes(partes, compressao="nenhuma"):
+    if compressao == "gzip":
+        compressor = zlib.compressobj(wbits=31)
+        comprimir, finalizar = compressor.compress, compressor.flush
+    elif compressao == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+        comprimir, finalizar = compressor.compress, compressor.flush
+    else:
+        comprimir, finalizar = (lambda dados: dados), (lambda: b"")
+    bloco = []
+    tamanho = 0
+    for parte in partes:
+        bloco.append(parte)
+        tamanho += len(parte)
+        if tamanho >= CHUNK_SIZE:
+            saida = comprimir("".join(bloco).encode("utf-8"))
+            if saida:
+                yield saida
+            bloco, tamanho = [], 0
+    saida = comprimir("".join(bloco).encode("utf-8")) + finalizar()
+    if saida:
+        yield saida
+
+def iter_export(db, formato, colecao="atendimentos", compressao="nenhuma", **filtros):
+    # Verificado já na chamada (antes de gerar qualquer bloco), para quem chama falhar antes de abrir a saída
+    if compressao not in COMPRESSOES:
+        raise ValueError(f"Compressão indisponível: {compressao} (opções: {', '.join(COMPRESSOES)})")
+    if formato == "json":
+        partes = iter_json(db, **filtros)
+    elif formato == "ndjson":
+        partes = iter_ndjson(db, colecao, **filtros)
+    else:
+        partes = iter_csv(db, colecao, **filtros)
+    return iter_bytes(partes, compressao)
+
+def file_name(formato, colecao="atendimentos", compressao="nenhuma"):
+    nome = "database_export" if formato == "json" else f"{colecao}_export"
+    return f"{nome}.{EXTENSOES[formato]}{EXTENSOES.get(compressao, '')}"
+
+def mime_type(formato, compressao="nenhuma"):
+    if compressao == "gzip":
+        return "application/gzip"
+    if compressao == "zstd":
+        return "application/zstd"
+    return MIMES[formato]
+
+# Gera a exportação em blocos num arquivo temporário (em memória até 8 MB, depois em disco) e devolve o
+# conteúdo em bytes: o download adiado do Streamlit só aceita bytes, str ou arquivos comuns, e de todo
+# modo carrega o arquivo inteiro em memória
+def export_bytes(db, formato, colecao="atendimentos", compressao="nenhuma", **filtros):
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as arquivo:
+        with span("export"):
+            for bloco in iter_export(db, formato, colecao, compressao, **filtros):
+                arquivo.write(bloco)
+        record_bytes("export", gravados=arquivo.tell())
+        arquivo.seek(0)
+        return arquivo.read()
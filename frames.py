@@ -0,0 +1,102 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Colunas das listagens de cada coleção
+COLUNAS = {
+    "atendimentos": ["idNumPropostas", "idRazaoSocial", "idCNPJ", "idConsultor", "idChecagem", "idData", "idEtapa"],
+    "propostas": ["idNumPropostas", "idRazaoSocial", "idCNPJ", "idProduto", "idHorasContratadas", "idData"]
+}
+
+# Colunas pelas quais as listagens podem ser ordenadas (None = ordem de cadastro)
+ORDENACOES = ("idData", "idNumPropostas")
+
+# Mesmo critério de format_date, aplicado à coluna inteira de uma vez
+def normalize_dates(serie):
+    if serie.isna().all():
+        return serie
+    return serie.astype("string").str.split("T", n=1).str[0]
+
+def build_frame(registros, colecao="atendimentos", inicio=0):
+    colunas = COLUNAS[colecao]
+    frame = pd.DataFrame.from_records(
+        [[registro.get(coluna) for coluna in colunas] for registro in registros],
+        columns=colunas,
+        index=pd.RangeIndex(inicio, inicio + len(registros))
+    )
+    frame["idData"] = normalize_dates(frame["idData"])
+    return frame
+
+# Descrição da etapa ("1 - Primeiro Contato") anexada por um único merge
+def attach_etapas(frame, etapas):
+    descricoes = pd.DataFrame.from_records(
+        [[e.get("id_etapa"), f"{e.get('id_etapa')} - {e.get('descricao')}"] for e in etapas],
+        columns=["idEtapa", "etapa_desc"]
+    ).drop_duplicates("idEtapa", keep="last")
+    tabela = frame.reset_index(names="pos").merge(descricoes, how="left", on="idEtapa").set_index("pos")
+    tabela["etapa_desc"] = tabela["etapa_desc"].fillna("")
+    return tabela
+
+# Máscara booleana vetorizada dos filtros da listagem; None significa "Todos"
+def filter_mask(frame, status=None, consultor=None, etapa=None):
+    mascara = pd.Series(True, index=frame.index)
+    if status is not None:
+        mascara &= frame["idChecagem"] == status
+    if consultor is not None:
+        mascara &= frame["idConsultor"] == consultor
+    if etapa is not None:
+        mascara &= frame["idEtapa"] == etapa
+    return mascara
+
+# Uma página da listagem: percorre a ordem pré-calculada só com os registros que passam na máscara,
+# sem reordenar; retorna as linhas da página e o total de registros filtrados
+def paginate(frame, ordem, mascara, pagina, tamanho, crescente=True):
+    if not crescente:
+        ordem = ordem[::-1]
+    selecionados = ordem[mascara.to_numpy()[ordem]]
+    inicio = (pagina - 1) * tamanho
+    return frame.iloc[selecionados[inicio:inicio + tamanho]], len(selecionados)
+
+# Coleção em formato colunar, indexada pela posição; inclusões ficam pendentes e são
+# concatenadas de uma vez na próxima leitura, alterações mudam só a linha afetada
+class CollectionFrame:
+    def __init__(self, db, colecao="atendimentos"):
+        self.colecao = colecao
+        self._lock = threading.Lock()
+        self._frame = build_frame(db[colecao], colecao)
+        self._pendentes = []
+        self._ordens = {}
+
+    def apply(self, db, entrada, anterior, pos):
+        if entrada["colecao"] != self.colecao:
+            return
+        with self._lock:
+            self._ordens = {}
+            if entrada["op"] == "insert":
+                self._pendentes.append(entrada["registro"])
+            elif pos >= len(self._frame):
+                self._pendentes[pos - len(self._frame)] = entrada["registro"]
+            else:
+                linha = build_frame([entrada["registro"]], self.colecao, pos)
+                self._frame.loc[pos, linha.columns] = linha.loc[pos]
+
+    def frame(self):
+        with self._lock:
+            if self._pendentes:
+                novos = build_frame(self._pendentes, self.colecao, len(self._frame))
+                self._frame = pd.concat([self._frame, novos]) if len(self._frame) else novos
+                self._pendentes = []
+            return self._frame
+
+    # Posições ordenadas pela coluna, calculadas uma vez por versão dos dados
+    def order(self, coluna=None):
+        frame = self.frame()
+        with self._lock:
+            if coluna not in self._ordens:
+                if coluna is None:
+                    ordem = np.arange(len(frame))
+                else:
+                    ordem = np.argsort(frame[coluna].fillna("").astype(str).to_numpy(), kind="stable")
+                self._ordens[coluna] = ordem
+            return self._ordens[coluna]
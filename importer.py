@@ -0,0 +1,141 @@
+import csv
+import os
+import unicodedata
+
+from storage import get_storage
+from validation import VALIDADORES, parse_date
+
+# Coleções que podem ser importadas em lote e os cabeçalhos aceitos para cada campo
+# (nome do campo ou rótulo da interface; acentos, maiúsculas e pontuação são ignorados)
+CABECALHOS = {
+    "propostas": {
+        "idNumPropostas": ["Nº Proposta", "Número da Proposta", "Proposta"],
+        "idRazaoSocial": ["Razão Social"],
+        "idCNPJ": ["CNPJ"],
+        "idProduto": ["Produto"],
+        "idHorasContratadas": ["Horas Contratadas", "Horas"],
+        "idData": ["Data da Proposta", "Data"]
+    },
+    "atendimentos": {
+        "idChecagem": ["Status"],
+        "idNumPropostas": ["Nº Proposta", "Número da Proposta", "Proposta"],
+        "idRazaoSocial": ["Razão Social"],
+        "idEtapa": ["Etapa"],
+        "idObservacao": ["Observações", "Observação"],
+        "idHoraVisita": ["Hora Visita"],
+        "idDataVisita": ["Data Visita"],
+        "idConsultor": ["Consultor"],
+        "idAtendNIF": ["NIF Atendimento", "NIF"],
+        "idCNPJ": ["CNPJ"],
+        "idProduto": ["Produto"],
+        "idHoraAtend": ["Hora Atendimento"],
+        "idData": ["Data Atendimento", "Data"]
+    }
+}
+
+def _normalize(texto):
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return "".join(c for c in texto.lower() if c.isalnum())
+
+def _header_map(colecao, cabecalho):
+    aceitos = {}
+    for campo, rotulos in CABECALHOS[colecao].items():
+        for rotulo in [campo] + rotulos:
+            aceitos.setdefault(_normalize(rotulo), campo)
+    return [aceitos.get(_normalize(coluna)) if coluna is not None else None for coluna in cabecalho]
+
+def _text(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+# Linha do CSV em UTF-8 ou, se não for UTF-8 válido, em cp1252 (o padrão do Excel no Windows em
+# português); decodificada linha a linha para manter a leitura em uma passada
+def _decode(linha):
+    try:
+        return linha.decode("utf-8")
+    except UnicodeDecodeError:
+        return linha.decode("cp1252", errors="replace")
+
+# Lê as linhas do arquivo (CSV ou XLSX) uma a uma, sem carregar a planilha inteira;
+# gera (número da linha no arquivo, valores) a partir da linha 2, e o cabeçalho primeiro
+def read_rows(arquivo, nome):
+    if os.path.splitext(nome)[1].lower() in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+        planilha = load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            yield from enumerate(planilha.active.iter_rows(values_only=True), start=1)
+        finally:
+            planilha.close()
+        return
+    texto = (_decode(linha) for linha in arquivo)
+    primeira = next(texto, "").removeprefix("\ufeff")
+    delimitador = ";" if primeira.count(";") > primeira.count(",") else ","
+    yield 1, next(csv.reader([primeira], delimiter=delimitador), [])
+    yield from enumerate(csv.reader(texto, delimiter=delimitador), start=2)
+
+# Converte uma linha da planilha no registro da coleção, no mesmo formato gravado pelos formulários
+def map_record(colecao, campos, valores):
+    linha = {campo: valor for campo, valor in zip(campos, valores) if campo}
+    registro = {campo: _text(linha.get(campo)) for campo in CABECALHOS[colecao]}
+    if colecao == "propostas":
+        # Valores não inteiros ("12,5") ficam como texto e são recusados pela validação
+        horas = linha.get("idHorasContratadas")
+        registro["idHorasContratadas"] = _text(horas)
+        if not _text(horas):
+            registro["idHorasContratadas"] = 0
+        else:
+            try:
+                numero = float(str(horas).replace(",", "."))
+            except ValueError:
+                numero = None
+            if numero is not None and numero.is_integer():
+                registro["idHorasContratadas"] = int(numero)
+        registro["idData"] = parse_date(linha.get("idData")) or registro["idData"] or None
+    else:
+        registro["idChecagem"] = registro["idChecagem"] or "Não Lançado"
+        registro["idEtapa"] = registro["idEtapa"].split(" - ")[0].strip()
+        for campo in ("idData", "idDataVisita"):
+            registro[campo] = parse_date(linha.get(campo)) or registro[campo] or None
+        for campo in ("idObservacao", "idHoraAtend"):
+            registro[campo] = registro[campo] or None
+    return registro
+
+# Valida todas as linhas numa única passada contra os índices do banco (e as chaves já aceitas no lote);
+# retorna (registros válidos, erros) com erros como (linha, mensagem)
+def validate_rows(indices, colecao, linhas):
+    validar = VALIDADORES[colecao]
+    registros, erros, chaves = [], [], set()
+    campos = None
+    for numero, valores in linhas:
+        if campos is None:
+            campos = _header_map(colecao, valores)
+            if "idNumPropostas" not in campos:
+                erros.append((numero, "Cabeçalho sem a coluna Nº Proposta"))
+                break
+            continue
+        if not any(_text(valor) for valor in valores):
+            continue
+        registro = map_record(colecao, campos, valores)
+        problemas = validar(registro, indices, chaves)
+        if problemas:
+            erros.extend((numero, problema) for problema in problemas)
+        else:
+            registros.append(registro)
+            if colecao == "propostas":
+                chaves.add(registro["idNumPropostas"])
+    return registros, erros
+
+# Importa o arquivo numa única gravação. Por padrão nada é gravado se houver erros;
+# com parcial=True, as linhas válidas são gravadas e as demais apenas relatadas
+def import_file(colecao, arquivo, nome, parcial=False, path=None):
+    backend = get_storage(path)
+    db = backend.load_database()
+    registros, erros = validate_rows(backend.get_indexes(db), colecao, read_rows(arquivo, nome))
+    importados = 0
+    if registros and (parcial or not erros):
+        backend.insert_many(db, colecao, registros)
+        importados = len(registros)
+    return {"importados": importados, "validos": len(registros), "erros": erros}
@@ -0,0 +1,42 @@
+from records import CHAVES
+
+# Índices em memória do banco carregado: buscas O(1) das propostas, consultores e etapas por chave
+class Indexes:
+    def __init__(self, db):
+        self.propostas = {}
+        self.consultores = {}
+        self.etapas = {}
+        # Em chaves repetidas prevalece o último cadastro, como na atualização dos atendimentos relacionados
+        for proposta in db["propostas"]:
+            self.propostas[proposta.get("idNumPropostas")] = proposta
+        for consultor in db["consultores"]:
+            self.consultores[consultor.get("id_consultores")] = consultor
+        for etapa in db["etapas"]:
+            self.etapas[etapa.get("id_etapa")] = etapa
+
+    # Manutenção incremental: chamada pelo storage a cada lançamento aplicado ao banco. Os atendimentos
+    # guardam só as chaves (resolvidas em resolve()), então nada aqui depende deles
+    def apply(self, db, entrada, anterior, pos):
+        colecao = entrada["colecao"]
+        if colecao == "atendimentos":
+            return
+        registro = entrada["registro"]
+        campo = CHAVES[colecao]
+        por_chave = getattr(self, colecao)
+        if anterior is not None and anterior.get(campo) != registro.get(campo):
+            por_chave.pop(anterior.get(campo), None)
+        por_chave[registro.get(campo)] = registro
+
+    # Atendimento com detalhesProposta/detalhesConsultor resolvidos pelas chaves
+    def resolve(self, atendimento):
+        id_proposta = atendimento.get("idNumPropostas")
+        id_consultor = atendimento.get("idConsultor")
+        # copy() devolve um dict comum também para os atendimentos compactos (records.Atendimento)
+        resolvido = atendimento.copy()
+        resolvido["detalhesProposta"] = self.propostas.get(id_proposta) if id_proposta else None
+        resolvido["detalhesConsultor"] = self.consultores.get(id_consultor) if id_consultor else None
+        return resolvido
+
+    def etapa_desc(self, id_etapa):
+        etapa = self.etapas.get(id_etapa)
+        return f"{etapa['id_etapa']} - {etapa['descricao']}" if etapa else ""
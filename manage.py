@@ -0,0 +1,112 @@
+import argparse
+
+import storage
+from archive import HOT_MONTHS
+from export import COMPRESSOES
+
+# Comandos de manutenção do banco de dados (python manage.py --help)
+def cmd_migrate_sqlite(args):
+    from sqlite_storage import migrate_json_to_sqlite
+    totais = migrate_json_to_sqlite(args.origem, args.destino)
+    for colecao, total in totais.items():
+        print(f"{colecao}: {total} registros migrados")
+
+def cmd_normalize(args):
+    backend = storage.get_storage(args.db)
+    db = backend.load_database()
+    backend.save_database(db)
+    print(f"Banco regravado sem as cópias de propostas/consultores ({len(db['atendimentos'])} atendimentos).")
+
+def cmd_export(args):
+    from export import iter_export
+    db = storage.get_storage(args.db).load_database()
+    filtros = {"desde": args.desde, "ate": args.ate, "consultor": args.consultor, "status": args.status,
+               "arquivo": storage.get_storage(args.db).get_archive()}
+    blocos = iter_export(db, args.formato, args.colecao, args.compressao, **filtros)
+    with open(args.saida, "wb") as f:
+        for bloco in blocos:
+            f.write(bloco)
+    print(f"Exportação gravada em {args.saida}")
+
+def cmd_import(args):
+    from importer import import_file
+    with open(args.arquivo, "rb") as f:
+        resultado = import_file(args.colecao, f, args.arquivo, args.parcial, args.db)
+    for linha, erro in resultado["erros"]:
+        print(f"Linha {linha}: {erro}")
+    if resultado["erros"] and not args.parcial:
+        print(f"Nada importado: {len(resultado['erros'])} erros ({resultado['validos']} linhas válidas).")
+    else:
+        print(f"{resultado['importados']} {args.colecao} importados.")
+
+def cmd_compact(args):
+    storage.get_storage(args.db).compact_database()
+    print("Banco compactado.")
+
+def cmd_rebuild_stats(args):
+    backend = storage.get_storage(args.db)
+    backend.rebuild_aggregates()
+    backend.get_archive().rebuild_aggregates()
+    totais = backend.get_aggregates(backend.load_database()).state()["total"]
+    for colecao, total in sorted(totais.items()):
+        print(f"{colecao}: {total}")
+    print("Estatísticas recalculadas.")
+
+def cmd_archive(args):
+    from archive import cutoff_month
+    backend = storage.get_storage(args.db)
+    antes = cutoff_month(args.meses)
+    total = backend.archive_atendimentos(antes, args.etapa)
+    arquivo = backend.get_archive()
+    print(f"{total} atendimentos anteriores a {antes} arquivados ({arquivo.total()} no arquivo, {len(arquivo.months())} meses).")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção do banco do Sistema de Atendimentos")
+    parser.add_argument("--db", default=storage.DB_FILE, help="Arquivo do banco (padrão: %(default)s)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("migrate-sqlite", help="Importa um database.json para um banco SQLite")
+    p.add_argument("origem", help="Arquivo database.json de origem")
+    p.add_argument("destino", help="Arquivo SQLite de destino (.db, .sqlite)")
+    p.set_defaults(func=cmd_migrate_sqlite)
+
+    p = sub.add_parser("normalize", help="Remove dos atendimentos as cópias embutidas de propostas e consultores")
+    p.set_defaults(func=cmd_normalize)
+
+    p = sub.add_parser("export", help="Exporta o banco em blocos (JSON, NDJSON ou CSV, opcionalmente comprimido)")
+    p.add_argument("saida", help="Arquivo de saída")
+    p.add_argument("--formato", choices=["json", "ndjson", "csv"], default="json")
+    p.add_argument("--colecao", choices=["atendimentos", "propostas", "consultores", "etapas"], default="atendimentos",
+                   help="Coleção exportada em NDJSON/CSV")
+    p.add_argument("--compressao", choices=COMPRESSOES, default="nenhuma",
+                   help="zstd requer o pacote zstandard")
+    p.add_argument("--desde", help="Data Atendimento inicial (AAAA-MM-DD)")
+    p.add_argument("--ate", help="Data Atendimento final (AAAA-MM-DD)")
+    p.add_argument("--consultor", help="Somente atendimentos deste consultor")
+    p.add_argument("--status", choices=["Lançado", "Não Lançado"], help="Somente atendimentos com este status")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="Importa atendimentos ou propostas de um arquivo CSV ou XLSX numa única gravação")
+    p.add_argument("arquivo", help="Arquivo CSV (separado por ; ou ,) ou XLSX")
+    p.add_argument("--colecao", choices=["atendimentos", "propostas"], default="atendimentos")
+    p.add_argument("--parcial", action="store_true", help="Grava as linhas válidas mesmo se outras tiverem erros")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("compact", help="Incorpora o journal ao snapshot (ou faz o checkpoint do WAL)")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser("rebuild-stats", help="Recalcula do zero as estatísticas gravadas junto ao banco")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    p = sub.add_parser("archive", help="Move para o arquivo por mês os atendimentos encerrados mais antigos")
+    p.add_argument("--meses", type=int, default=HOT_MONTHS,
+                   help="Meses mantidos no banco ativo, contando o atual (padrão: %(default)s)")
+    p.add_argument("--etapa", action="append",
+                   help="Etapa final (id_etapa); pode ser repetida (padrão: a última etapa cadastrada)")
+    p.set_defaults(func=cmd_archive)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import io
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Instrumentação leve dos caminhos quentes: cada trecho medido (span) acumula, por processo, contagem,
+# soma, histograma de latência, bytes lidos/gravados e as amostras recentes para os percentis
+
+# Limites dos baldes do histograma, em segundos (os padrões do Prometheus)
+BALDES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AMOSTRAS = 2048
+
+_lock = threading.Lock()
+_spans = {}
+
+def _span_stats(nome):
+    estatisticas = _spans.get(nome)
+    if estatisticas is None:
+        estatisticas = _spans[nome] = {
+            "contagem": 0,
+            "soma": 0.0,
+            "baldes": [0] * len(BALDES),
+            "amostras": deque(maxlen=AMOSTRAS),
+            "bytes_lidos": 0,
+            "bytes_gravados": 0
+        }
+    return estatisticas
+
+def observe(nome, segundos):
+    with _lock:
+        estatisticas = _span_stats(nome)
+        estatisticas["contagem"] += 1
+        estatisticas["soma"] += segundos
+        estatisticas["amostras"].append(segundos)
+        for i, limite in enumerate(BALDES):
+            if segundos <= limite:
+                estatisticas["baldes"][i] += 1
+                break
+
+def record_bytes(nome, lidos=0, gravados=0):
+    with _lock:
+        estatisticas = _span_stats(nome)
+        estatisticas["bytes_lidos"] += lidos
+        estatisticas["bytes_gravados"] += gravados
+
+# Mede o trecho, inclusive quando termina com exceção (o st.rerun do Streamlit, por exemplo)
+@contextmanager
+def span(nome):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(nome, time.perf_counter() - inicio)
+
+def _percentil(ordenadas, p):
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))]
+
+# Resumo por span; os percentis consideram as últimas AMOSTRAS medições
+def stats():
+    with _lock:
+        copia = {nome: dict(e, amostras=sorted(e["amostras"])) for nome, e in _spans.items()}
+    return {
+        nome: {
+            "contagem": e["contagem"],
+            "soma": e["soma"],
+            "p50": _percentil(e["amostras"], 50),
+            "p95": _percentil(e["amostras"], 95),
+            "p99": _percentil(e["amostras"], 99),
+            "bytes_lidos": e["bytes_lidos"],
+            "bytes_gravados": e["bytes_gravados"]
+        }
+        for nome, e in sorted(copia.items())
+    }
+
+def reset():
+    with _lock:
+        _spans.clear()
+
+def _rotulo(nome):
+    return nome.replace("\\", "\\\\").replace('"', '\\"')
+
+# Estatísticas no formato texto de exposição do Prometheus
+def prometheus_text():
+    with _lock:
+        copia = {nome: dict(e, baldes=list(e["baldes"])) for nome, e in _spans.items()}
+    linhas = [
+        "# HELP jtd_span_seconds Duração dos trechos instrumentados.",
+        "# TYPE jtd_span_seconds histogram"
+    ]
+    for nome, e in sorted(copia.items()):
+        rotulo = _rotulo(nome)
+        acumulado = 0
+        for limite, quantidade in zip(BALDES, e["baldes"]):
+            acumulado += quantidade
+            linhas.append(f'jtd_span_seconds_bucket{{span="{rotulo}",le="{limite}"}} {acumulado}')
+        linhas.append(f'jtd_span_seconds_bucket{{span="{rotulo}",le="+Inf"}} {e["contagem"]}')
+        linhas.append(f'jtd_span_seconds_sum{{span="{rotulo}"}} {e["soma"]}')
+        linhas.append(f'jtd_span_seconds_count{{span="{rotulo}"}} {e["contagem"]}')
+    for metrica, campo, descricao in (
+        ("jtd_span_bytes_read_total", "bytes_lidos", "Bytes lidos do disco pelo trecho."),
+        ("jtd_span_bytes_written_total", "bytes_gravados", "Bytes gravados no disco pelo trecho.")
+    ):
+        linhas += [f"# HELP {metrica} {descricao}", f"# TYPE {metrica} counter"]
+        for nome, e in sorted(copia.items()):
+            if e[campo]:
+                linhas.append(f'{metrica}{{span="{_rotulo(nome)}"}} {e[campo]}')
+    return "\n".join(linhas) + "\n"
+
+# Executa a função sob o cProfile e entrega o relatório (texto ordenado por tempo acumulado e o
+# arquivo .prof, para o snakeviz) a guardar, mesmo que a função termine com exceção
+def profile_call(funcao, guardar, linhas=60):
+    import cProfile
+    import pstats
+    import tempfile
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        return funcao()
+    finally:
+        perfil.disable()
+        texto = io.StringIO()
+        pstats.Stats(perfil, stream=texto).sort_stats("cumulative").print_stats(linhas)
+        with tempfile.NamedTemporaryFile(suffix=".prof", delete=False) as f:
+            arquivo = f.name
+        try:
+            perfil.dump_stats(arquivo)
+            with open(arquivo, "rb") as f:
+                binario = f.read()
+        finally:
+            os.remove(arquivo)
+        guardar({"texto": texto.getvalue(), "prof": binario})
@@ -0,0 +1,135 @@
+import sys
+from collections.abc import Mapping, MutableMapping
+
+# Campos dos atendimentos, na ordem em que são gravados
+CAMPOS_ATENDIMENTO = (
+    "idAtendimento", "versao", "idChecagem", "idNumPropostas", "idRazaoSocial", "idEtapa", "idObservacao",
+    "idHoraVisita", "idDataVisita", "idConsultor", "idAtendNIF", "idCNPJ",
+    "idProduto", "idHoraAtend", "idData"
+)
+_CAMPOS = frozenset(CAMPOS_ATENDIMENTO)
+
+# Campo chave de cada coleção de cadastro; atendimentos são identificados por idAtendimento (estável)
+# e carregam um número de versão incrementado a cada alteração
+CHAVES = {
+    "propostas": "idNumPropostas",
+    "consultores": "id_consultores",
+    "etapas": "id_etapa"
+}
+_AUSENTE = object()
+
+# Campos com poucos valores distintos, repetidos em muitos atendimentos (status, etapa, consultor e os
+# dados copiados da proposta): os textos são internados e todos os registros apontam para a mesma cópia
+CATEGORICOS = frozenset((
+    "idChecagem", "idNumPropostas", "idRazaoSocial", "idEtapa", "idHoraVisita", "idConsultor",
+    "idAtendNIF", "idCNPJ", "idProduto", "idHoraAtend"
+))
+
+# Atendimento em memória: um slot por campo em vez de um dict com as 15 chaves repetidas em cada registro.
+# Funciona como um dict (get, [], in, items, dict(atendimento), ...); campos fora da lista, de versões
+# antigas ou futuras, ficam num dict à parte, criado só quando existem. Campo ausente é slot vazio
+class Atendimento(MutableMapping):
+    __slots__ = CAMPOS_ATENDIMENTO + ("_extras",)
+
+    def __init__(self, registro=()):
+        self._extras = None
+        for campo, valor in (registro.items() if isinstance(registro, Mapping) else registro):
+            if campo in CATEGORICOS:
+                if type(valor) is str:
+                    valor = sys.intern(valor)
+            elif campo not in _CAMPOS:
+                self[campo] = valor
+                continue
+            setattr(self, campo, valor)
+
+    def __getitem__(self, campo):
+        if campo in _CAMPOS:
+            try:
+                return getattr(self, campo)
+            except AttributeError:
+                raise KeyError(campo) from None
+        if self._extras is None:
+            raise KeyError(campo)
+        return self._extras[campo]
+
+    def get(self, campo, padrao=None):
+        if campo in _CAMPOS:
+            return getattr(self, campo, padrao)
+        return self._extras.get(campo, padrao) if self._extras is not None else padrao
+
+    def __setitem__(self, campo, valor):
+        if campo in _CAMPOS:
+            if campo in CATEGORICOS and type(valor) is str:
+                valor = sys.intern(valor)
+            setattr(self, campo, valor)
+        else:
+            if self._extras is None:
+                self._extras = {}
+            self._extras[campo] = valor
+
+    def __delitem__(self, campo):
+        if campo in _CAMPOS:
+            try:
+                delattr(self, campo)
+            except AttributeError:
+                raise KeyError(campo) from None
+        else:
+            if self._extras is None:
+                raise KeyError(campo)
+            del self._extras[campo]
+            if not self._extras:
+                self._extras = None
+
+    def __contains__(self, campo):
+        if campo in _CAMPOS:
+            return hasattr(self, campo)
+        return self._extras is not None and campo in self._extras
+
+    def __iter__(self):
+        for campo in CAMPOS_ATENDIMENTO:
+            if hasattr(self, campo):
+                yield campo
+        if self._extras is not None:
+            yield from self._extras
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    # dict comum com os mesmos campos (mais rápido que dict(atendimento))
+    def to_dict(self):
+        registro = {
+            campo: valor for campo in CAMPOS_ATENDIMENTO if (valor := getattr(self, campo, _AUSENTE)) is not _AUSENTE
+        }
+        if self._extras is not None:
+            registro.update(self._extras)
+        return registro
+
+    copy = to_dict
+
+    def __repr__(self):
+        return f"Atendimento({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return Atendimento, (self.to_dict(),)
+
+# Registro na representação em memória da coleção (só os atendimentos têm uma compacta)
+def pack(colecao, registro):
+    if colecao == "atendimentos" and not isinstance(registro, Atendimento):
+        return Atendimento(registro)
+    return registro
+
+# Converte os atendimentos do banco lido (em lugar); os já convertidos ficam como estão
+def pack_database(db):
+    atendimentos = db["atendimentos"]
+    for pos, atendimento in enumerate(atendimentos):
+        if not isinstance(atendimento, Atendimento):
+            atendimentos[pos] = Atendimento(atendimento)
+    return db
+
+# Para json.dump(..., default=json_default): grava os atendimentos compactos como objetos JSON
+def json_default(valor):
+    if isinstance(valor, Atendimento):
+        return valor.to_dict()
+    if isinstance(valor, Mapping):
+        return dict(valor)
+    raise TypeError(f"Object of type {type(valor).__name__} is not JSON serializable")
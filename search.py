@@ -0,0 +1,122 @@
+import bisect
+import re
+import threading
+import unicodedata
+
+# Campos pesquisáveis de cada coleção e o peso de cada um na ordenação dos resultados
+CAMPOS_BUSCA = {
+    "atendimentos": {"idNumPropostas": 3, "idRazaoSocial": 3, "idCNPJ": 3, "idProduto": 2, "idObservacao": 1},
+    "propostas": {"idNumPropostas": 3, "idRazaoSocial": 3, "idCNPJ": 3, "idProduto": 2}
+}
+
+# Palavras que não ajudam a distinguir registros
+STOPWORDS = {"a", "o", "e", "de", "da", "do", "das", "dos", "em", "na", "no", "para", "com"}
+
+_CNPJ = re.compile(r"[\d./-]*\d[\d./-]*")
+
+def normalize_text(texto):
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return texto.lower()
+
+def tokenize(texto):
+    return [t for t in re.findall(r"[a-z0-9]+", normalize_text(texto)) if t not in STOPWORDS]
+
+# CNPJ vira um único termo só com os dígitos ("12.345.678/0001-90" -> "12345678000190")
+def _field_tokens(campo, valor):
+    if valor in (None, ""):
+        return []
+    if campo == "idCNPJ":
+        digitos = re.sub(r"\D", "", str(valor))
+        return [digitos] if digitos else tokenize(valor)
+    return tokenize(valor)
+
+# Termos da consulta; trechos só com dígitos e pontuação de CNPJ também viram só os dígitos
+def query_terms(consulta):
+    termos = []
+    for trecho in str(consulta).split():
+        if _CNPJ.fullmatch(trecho):
+            termos.append(re.sub(r"\D", "", trecho))
+        else:
+            termos.extend(tokenize(trecho))
+    return termos
+
+# Índice invertido termo -> {posição: peso}, com o vocabulário ordenado para a busca por prefixo.
+# Mantido a cada gravação, como os demais derivados do storage
+class SearchIndex:
+    def __init__(self, db, colecao="atendimentos"):
+        self.colecao = colecao
+        self._lock = threading.Lock()
+        self._campos = CAMPOS_BUSCA[colecao]
+        self._postings = {}
+        for pos, registro in enumerate(db[colecao]):
+            for termo, peso in self._terms(registro).items():
+                self._postings.setdefault(termo, {})[pos] = peso
+        self._vocabulario = sorted(self._postings)
+
+    def _terms(self, registro):
+        termos = {}
+        for campo, peso in self._campos.items():
+            for termo in _field_tokens(campo, registro.get(campo)):
+                termos[termo] = termos.get(termo, 0) + peso
+        return termos
+
+    def _add(self, pos, registro):
+        for termo, peso in self._terms(registro).items():
+            if termo not in self._postings:
+                self._postings[termo] = {}
+                bisect.insort(self._vocabulario, termo)
+            self._postings[termo][pos] = peso
+
+    def _remove(self, pos, registro):
+        for termo in self._terms(registro):
+            postings = self._postings.get(termo)
+            if postings is None:
+                continue
+            postings.pop(pos, None)
+            if not postings:
+                del self._postings[termo]
+                del self._vocabulario[bisect.bisect_left(self._vocabulario, termo)]
+
+    def apply(self, db, entrada, anterior, pos):
+        if entrada["colecao"] != self.colecao:
+            return
+        with self._lock:
+            if anterior is not None:
+                self._remove(pos, anterior)
+            self._add(pos, entrada["registro"])
+
+    # Pontuação de cada registro para um termo: termos iguais valem o dobro dos que só começam por ele.
+    # Termos de uma letra não são expandidos por prefixo
+    def _match(self, termo):
+        pontos = {}
+        if len(termo) > 1:
+            i = bisect.bisect_left(self._vocabulario, termo)
+            while i < len(self._vocabulario) and self._vocabulario[i].startswith(termo):
+                candidato = self._vocabulario[i]
+                fator = 2 if candidato == termo else 1
+                for pos, peso in self._postings[candidato].items():
+                    pontos[pos] = pontos.get(pos, 0) + peso * fator
+                i += 1
+        else:
+            for pos, peso in self._postings.get(termo, {}).items():
+                pontos[pos] = peso * 2
+        return pontos
+
+    # Posições dos registros que contêm todos os termos (ou termos que começam por eles),
+    # dos mais relevantes para os menos; no empate, os mais recentes primeiro
+    def search(self, consulta, limite=None):
+        termos = query_terms(consulta)
+        if not termos:
+            return []
+        with self._lock:
+            resultado = None
+            for termo in sorted(set(termos), key=len, reverse=True):
+                pontos = self._match(termo)
+                if resultado is None:
+                    resultado = pontos
+                else:
+                    resultado = {pos: total + pontos[pos] for pos, total in resultado.items() if pos in pontos}
+                if not resultado:
+                    return []
+        ordem = sorted(resultado, key=lambda pos: (-resultado[pos], -pos))
+        return ordem[:limite] if limite is not None else ordem
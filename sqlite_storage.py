@@ -0,0 +1,261 @@
+import os
+import shutil
+import sqlite3
+
+from aggregates import Aggregates, deltas
+from profiling import span
+from records import pack
+from storage import Storage, CAMPOS, CHAVES, assign_ids, default_database, _stat
+
+# Colunas de cada tabela (os campos de cada coleção); "pos" preserva a ordem de cadastro
+COLUNAS = CAMPOS
+
+INDICES = [
+    ("atendimentos", "idAtendimento"),
+    ("atendimentos", "idNumPropostas"),
+    ("atendimentos", "idConsultor"),
+    ("atendimentos", "idEtapa"),
+    ("atendimentos", "idChecagem"),
+    ("atendimentos", "idData"),
+    ("propostas", "idNumPropostas"),
+    ("propostas", "idData"),
+    ("consultores", "id_consultores"),
+    ("etapas", "id_etapa")
+]
+
+def _to_row(colecao, registro):
+    return [registro.get(coluna) for coluna in COLUNAS[colecao]]
+
+def _from_row(colecao, row):
+    return pack(colecao, {coluna: row[coluna] for coluna in COLUNAS[colecao]})
+
+# Backend SQLite (modo WAL) com tabelas indexadas; os filtros da listagem viram cláusulas WHERE
+class SqliteStorage(Storage):
+    def __init__(self, path):
+        super().__init__(path)
+        novo = not os.path.exists(path)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            sem_agregados = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'agregados'").fetchone() is None
+            with conn:
+                # Estatísticas materializadas, atualizadas na mesma transação de cada gravação
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS agregados (grupo TEXT, chave TEXT, valor INTEGER, PRIMARY KEY (grupo, chave))"
+                )
+                for colecao, colunas in COLUNAS.items():
+                    conn.execute(f"CREATE TABLE IF NOT EXISTS {colecao} (pos INTEGER PRIMARY KEY, {', '.join(colunas)})")
+                    # Bancos criados por versões anteriores
+                    existentes = {row["name"] for row in conn.execute(f"PRAGMA table_info({colecao})")}
+                    for coluna in colunas:
+                        if coluna not in existentes:
+                            conn.execute(f"ALTER TABLE {colecao} ADD COLUMN {coluna}")
+                conn.execute("UPDATE atendimentos SET idAtendimento = 'legado-' || pos WHERE idAtendimento IS NULL")
+                for colecao, coluna in INDICES:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{colecao}_{coluna} ON {colecao} ({coluna})")
+                if novo:
+                    for etapa in default_database()["etapas"]:
+                        self._insert(conn, "etapas", etapa)
+        finally:
+            conn.close()
+        # Bancos criados antes das estatísticas (ou recém-criados, com as etapas padrão)
+        if sem_agregados:
+            self.rebuild_aggregates()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _assinatura(self):
+        return (_stat(self.path), _stat(self.path + "-wal"))
+
+    # Lê todas as tabelas numa única transação de leitura
+    def _read(self):
+        db = {}
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            for colecao in COLUNAS:
+                rows = conn.execute(f"SELECT * FROM {colecao} ORDER BY pos")
+                db[colecao] = [_from_row(colecao, row) for row in rows]
+            agregados = Aggregates.from_rows(conn.execute("SELECT grupo, chave, valor FROM agregados"))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        self._derivados_lidos = {"aggregates": agregados}
+        return db
+
+    def _insert(self, conn, colecao, registro):
+        colunas = COLUNAS[colecao]
+        conn.execute(
+            f"INSERT INTO {colecao} (pos, {', '.join(colunas)}) "
+            f"VALUES ((SELECT COALESCE(MAX(pos) + 1, 0) FROM {colecao}), {', '.join('?' * len(colunas))})",
+            _to_row(colecao, registro)
+        )
+
+    def _update(self, conn, colecao, chave, registro):
+        colunas = COLUNAS[colecao]
+        atribuicoes = ", ".join(f"{coluna} = ?" for coluna in colunas)
+        if colecao == "atendimentos":
+            campo = "pos" if isinstance(chave, int) else "idAtendimento"
+            conn.execute(f"UPDATE {colecao} SET {atribuicoes} WHERE {campo} = ?", _to_row(colecao, registro) + [chave])
+        else:
+            conn.execute(
+                f"UPDATE {colecao} SET {atribuicoes} WHERE pos = (SELECT MAX(pos) FROM {colecao} WHERE {CHAVES[colecao]} = ?)",
+                _to_row(colecao, registro) + [chave]
+            )
+
+    # Exclusão pela mesma chave da alteração. "pos" segue igual à posição na lista em memória (as
+    # listagens devolvem pos): as linhas seguintes descem uma posição, em dois passos para não
+    # colidirem na chave primária
+    def _delete(self, conn, colecao, chave):
+        if colecao == "atendimentos" and isinstance(chave, int):
+            pos = chave
+        else:
+            campo = "idAtendimento" if colecao == "atendimentos" else CHAVES[colecao]
+            pos = conn.execute(f"SELECT MAX(pos) FROM {colecao} WHERE {campo} = ?", [chave]).fetchone()[0]
+        conn.execute(f"DELETE FROM {colecao} WHERE pos = ?", [pos])
+        conn.execute(f"UPDATE {colecao} SET pos = -pos WHERE pos > ?", [pos])
+        conn.execute(f"UPDATE {colecao} SET pos = -pos - 1 WHERE pos < 0")
+
+    def _add_aggregates(self, conn, variacoes):
+        conn.executemany(
+            "INSERT INTO agregados (grupo, chave, valor) VALUES (?, ?, ?) "
+            "ON CONFLICT (grupo, chave) DO UPDATE SET valor = valor + excluded.valor",
+            variacoes
+        )
+
+    def _persist(self, entradas, anteriores):
+        conn = self._connect()
+        try:
+            with span("storage.persist"), conn:
+                for entrada, anterior in zip(entradas, anteriores):
+                    if entrada["op"] == "insert":
+                        self._insert(conn, entrada["colecao"], entrada["registro"])
+                    elif entrada["op"] == "delete":
+                        self._delete(conn, entrada["colecao"], entrada["chave"])
+                    else:
+                        self._update(conn, entrada["colecao"], entrada["chave"], entrada["registro"])
+                    self._add_aggregates(conn, deltas(entrada, anterior))
+        finally:
+            conn.close()
+
+    # Regrava todas as tabelas numa única transação (usado pela migração do database.json)
+    def save_database(self, data):
+        with span("storage.save_database"), self._write_lock():
+            self._save(data)
+
+    def _save(self, data):
+        assign_ids(data)
+        agregados = Aggregates(data)
+        conn = self._connect()
+        try:
+            with conn:
+                for colecao in COLUNAS:
+                    conn.execute(f"DELETE FROM {colecao}")
+                    for registro in data.get(colecao, []):
+                        self._insert(conn, colecao, registro)
+                self._write_aggregates(conn, agregados)
+        finally:
+            conn.close()
+        self._set_cache(data, agregados)
+
+    def _write_aggregates(self, conn, agregados):
+        conn.execute("DELETE FROM agregados")
+        conn.executemany("INSERT INTO agregados (grupo, chave, valor) VALUES (?, ?, ?)", agregados.rows())
+
+    # Recalcula as estatísticas do zero, percorrendo todas as tabelas
+    def rebuild_aggregates(self):
+        with self._write_lock():
+            db = self._current()
+            agregados = Aggregates(db)
+            conn = self._connect()
+            try:
+                with conn:
+                    self._write_aggregates(conn, agregados)
+            finally:
+                conn.close()
+            self._set_cache(db, agregados)
+
+    # No SQLite a compactação é o checkpoint do WAL
+    def compact_database(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+
+    def _query_frame(self, sql, parametros):
+        import pandas as pd
+        from frames import normalize_dates
+        conn = self._connect()
+        try:
+            with span("sqlite.query"):
+                frame = pd.read_sql_query(sql, conn, params=parametros, index_col="pos")
+        finally:
+            conn.close()
+        frame["idData"] = normalize_dates(frame["idData"])
+        return frame
+
+    def _count(self, sql, parametros):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, parametros).fetchone()[0]
+        finally:
+            conn.close()
+
+    def _where(self, status=None, consultor=None, etapa=None):
+        condicoes, parametros = [], []
+        for coluna, valor in (("idChecagem", status), ("idConsultor", consultor), ("idEtapa", etapa)):
+            if valor is not None:
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(valor)
+        return (f"WHERE {' AND '.join(condicoes)}" if condicoes else ""), parametros
+
+    # ORDER BY sobre as colunas indexadas, com pos como desempate, e LIMIT/OFFSET da página
+    def _order_limit(self, ordenar_por, crescente, pagina, tamanho):
+        from frames import ORDENACOES
+        direcao = "ASC" if crescente else "DESC"
+        ordem = f"{ordenar_por} {direcao}, pos {direcao}" if ordenar_por in ORDENACOES else f"pos {direcao}"
+        return f"ORDER BY {ordem} LIMIT {int(tamanho)} OFFSET {(int(pagina) - 1) * int(tamanho)}"
+
+    def page_atendimentos(self, status=None, consultor=None, etapa=None,
+                          ordenar_por=None, crescente=True, pagina=1, tamanho=50):
+        from frames import COLUNAS as COLUNAS_LISTAGEM, attach_etapas
+        where, parametros = self._where(status, consultor, etapa)
+        frame = self._query_frame(
+            f"SELECT pos, {', '.join(COLUNAS_LISTAGEM['atendimentos'])} FROM atendimentos {where} "
+            f"{self._order_limit(ordenar_por, crescente, pagina, tamanho)}",
+            parametros
+        )
+        total = self._count(f"SELECT COUNT(*) FROM atendimentos {where}", parametros)
+        return attach_etapas(frame, self.load_database()["etapas"]), total
+
+    def page_propostas(self, ordenar_por=None, crescente=True, pagina=1, tamanho=50):
+        from frames import COLUNAS as COLUNAS_LISTAGEM
+        frame = self._query_frame(
+            f"SELECT pos, {', '.join(COLUNAS_LISTAGEM['propostas'])} FROM propostas "
+            f"{self._order_limit(ordenar_por, crescente, pagina, tamanho)}",
+            []
+        )
+        return frame, self._count("SELECT COUNT(*) FROM propostas", [])
+
+# Migração única: importa um database.json (snapshot + journal) para um banco SQLite. O arquivo frio
+# fica numa pasta ao lado do banco (<banco>.arquivo) e é copiado junto, substituindo o do destino:
+# sem ele os atendimentos arquivados sumiriam da listagem, das estatísticas e da exportação
+def migrate_json_to_sqlite(json_path, sqlite_path):
+    from storage import JsonStorage
+    origem = JsonStorage(json_path)
+    data = origem.load_database()
+    arquivados = origem.get_archive().total()
+    destino = SqliteStorage(sqlite_path)
+    pasta = destino.get_archive().pasta
+    if os.path.isdir(pasta):
+        shutil.rmtree(pasta)
+    if os.path.isdir(origem.get_archive().pasta):
+        shutil.copytree(origem.get_archive().pasta, pasta)
+    destino.save_database(data)
+    totais = {colecao: len(data[colecao]) for colecao in COLUNAS}
+    totais["atendimentos arquivados"] = arquivados
+    return totais
@@ -0,0 +1,650 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from aggregates import Aggregates
+from indexes import Indexes
+from profiling import record_bytes, span
+from records import CAMPOS_ATENDIMENTO, CHAVES, Atendimento, json_default, pack, pack_database
+
+# Configuração do armazenamento: database.json (padrão) ou um arquivo .db/.sqlite para o backend SQLite
+DB_FILE = os.environ.get("JTD_DB_FILE", "database.json")
+COMPACT_THRESHOLD = int(os.environ.get("JTD_COMPACT_THRESHOLD", 4 * 1024 * 1024))
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# Cópias de propostas/consultores que versões antigas gravavam dentro de cada atendimento;
+# hoje são resolvidas pelas chaves só na exibição e na exportação
+DETALHES = ("detalhesProposta", "detalhesConsultor")
+
+# Campos de cada coleção
+CAMPOS = {
+    "atendimentos": list(CAMPOS_ATENDIMENTO),
+    "propostas": ["idNumPropostas", "idRazaoSocial", "idCNPJ", "idProduto", "idHorasContratadas", "idData"],
+    "consultores": ["id_consultores", "id_NIF"],
+    "etapas": ["id_etapa", "descricao"]
+}
+
+def default_database():
+    return {
+        "atendimentos": [],
+        "consultores": [],
+        "etapas": [
+            {"id_etapa": "1", "descricao": "Primeiro Contato"},
+            {"id_etapa": "2", "descricao": "Análise de Necessidades"},
+            {"id_etapa": "3", "descricao": "Proposta Enviada"},
+            {"id_etapa": "4", "descricao": "Fechamento"}
+        ],
+        "propostas": []
+    }
+
+# Alteração rejeitada porque o registro mudou desde que foi lido (outra sessão ou processo gravou antes)
+class VersionConflict(Exception):
+    pass
+
+def new_id():
+    return uuid.uuid4().hex
+
+# Atendimentos gravados antes do idAtendimento recebem um id derivado da posição, igual em todos os processos;
+# retorna o mapa idAtendimento -> posição
+def assign_ids(db):
+    posicoes = {}
+    for pos, atendimento in enumerate(db["atendimentos"]):
+        if not atendimento.get("idAtendimento"):
+            atendimento["idAtendimento"] = f"legado-{pos}"
+        posicoes[atendimento["idAtendimento"]] = pos
+    return posicoes
+
+# Posição do registro; journals antigos endereçavam atendimentos pela posição na lista
+def _find(db, colecao, chave, posicoes=None):
+    if colecao == "atendimentos":
+        if isinstance(chave, int):
+            return chave
+        if posicoes is not None:
+            return posicoes[chave]
+        campo = "idAtendimento"
+    else:
+        campo = CHAVES[colecao]
+    for i in range(len(db[colecao]) - 1, -1, -1):
+        if db[colecao][i].get(campo) == chave:
+            return i
+    raise KeyError(chave)
+
+# Aplica o lançamento ao banco em memória (na representação compacta de records); retorna a posição afetada.
+# Uma exclusão desloca os registros seguintes uma posição para trás
+def _apply(db, entrada, posicoes=None):
+    colecao = entrada["colecao"]
+    if entrada["op"] == "delete":
+        pos = _find(db, colecao, entrada["chave"], posicoes)
+        removido = db[colecao].pop(pos)
+        if colecao == "atendimentos" and posicoes is not None:
+            posicoes.pop(removido.get("idAtendimento"), None)
+            for i in range(pos, len(db[colecao])):
+                posicoes[db[colecao][i]["idAtendimento"]] = i
+        return pos
+    registro = pack(colecao, entrada["registro"])
+    if entrada["op"] == "insert":
+        pos = len(db[colecao])
+        db[colecao].append(registro)
+        if colecao == "atendimentos" and posicoes is not None and entrada["registro"].get("idAtendimento"):
+            posicoes[entrada["registro"]["idAtendimento"]] = pos
+    else:
+        pos = _find(db, colecao, entrada["chave"], posicoes)
+        db[colecao][pos] = registro
+    return pos
+
+# Remove as cópias embutidas dos atendimentos; retorna quantos foram alterados
+def normalize_database(db):
+    alterados = 0
+    for atendimento in db["atendimentos"]:
+        if any(campo in atendimento for campo in DETALHES):
+            for campo in DETALHES:
+                atendimento.pop(campo, None)
+            alterados += 1
+    return alterados
+
+# Banco completo no formato de exportação, com os detalhes materializados em cada atendimento
+def export_database(db):
+    indices = get_indexes(db)
+    exportado = dict(db)
+    exportado["atendimentos"] = [indices.resolve(atendimento) for atendimento in db["atendimentos"]]
+    return exportado
+
+def _fsync_dir(path):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+# Escrita atômica: arquivo temporário + fsync + rename
+def atomic_write(path, escrever):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding='utf-8') as f:
+        escrever(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+# Mesmo texto de json.dump(data, f, ensure_ascii=False, indent=4), gravado registro a registro: cada
+# atendimento compacto vira dict só enquanto é serializado, sem uma cópia do banco inteiro em memória
+def dump_json(data, f):
+    codificador = json.JSONEncoder(ensure_ascii=False, indent=4)
+    f.write("{")
+    for i, (chave, valor) in enumerate(data.items()):
+        f.write(("," if i else "") + f"\n    {codificador.encode(chave)}: ")
+        if isinstance(valor, list) and valor:
+            f.write("[")
+            for j, registro in enumerate(valor):
+                texto = codificador.encode(registro.to_dict() if isinstance(registro, Atendimento) else registro)
+                f.write(("," if j else "") + "\n        " + texto.replace("\n", "\n        "))
+            f.write("\n    ]")
+        else:
+            f.write(codificador.encode(valor).replace("\n", "\n    "))
+    f.write("\n}")
+
+def _stat(path):
+    try:
+        info = os.stat(path)
+        return (info.st_mtime_ns, info.st_size)
+    except FileNotFoundError:
+        return None
+
+# Base dos backends: mantém um banco em memória por processo, compartilhado por todas as sessões
+# e reruns, e só relê o disco quando a assinatura dos arquivos (mtime e tamanho) muda.
+# Leituras e gravações do disco passam por um lock entre processos (arquivo .lock ao lado do banco)
+class Storage:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cache = {"db": None, "assinatura": None, "posicoes": {}, "versao": 0, "hits": 0, "misses": 0}
+        self._derivados = {}
+        # Derivados já prontos na leitura do disco (estatísticas gravadas junto ao banco)
+        self._derivados_lidos = {}
+        self._espera = {"gravacoes": 0, "segundos": 0.0, "maximo": 0.0}
+        self._arquivo = None
+
+    def lock_file(self):
+        return self.path + ".lock"
+
+    # Lock entre processos (compartilhado para leitura, exclusivo para gravação); sem fcntl,
+    # vale só o lock entre threads do processo
+    @contextmanager
+    def _file_lock(self, exclusivo=True):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_file(), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    # Gravação exclusiva, medindo quanto tempo se esperou pelos locks
+    @contextmanager
+    def _write_lock(self):
+        inicio = time.perf_counter()
+        with self._lock, self._file_lock():
+            espera = time.perf_counter() - inicio
+            self._espera["gravacoes"] += 1
+            self._espera["segundos"] += espera
+            self._espera["maximo"] = max(self._espera["maximo"], espera)
+            yield
+
+    def _reload(self, assinatura):
+        self._cache["misses"] += 1
+        with span("storage.read"):
+            db = self._read()
+        normalize_database(db)
+        pack_database(db)
+        self._cache["posicoes"] = assign_ids(db)
+        self._cache["db"] = db
+        self._cache["assinatura"] = assinatura
+        self._cache["versao"] += 1
+        self._derivados, self._derivados_lidos = self._derivados_lidos, {}
+        return db
+
+    def load_database(self):
+        with span("storage.load_database"), self._lock:
+            assinatura = self._assinatura()
+            if self._cache["db"] is not None and self._cache["assinatura"] == assinatura:
+                self._cache["hits"] += 1
+                return self._cache["db"]
+            with self._file_lock(exclusivo=False):
+                return self._reload(self._assinatura())
+
+    # Estruturas derivadas do banco em cache (índices, tabela colunar), construídas uma vez
+    # e mantidas a cada gravação pelo método apply(db, entrada, anterior, pos)
+    def _derivado(self, nome, db, fabrica):
+        with self._lock:
+            if self._cache["db"] is not db:
+                with span(f"derivado.{nome}"):
+                    return fabrica(db)
+            if nome not in self._derivados:
+                with span(f"derivado.{nome}"):
+                    self._derivados[nome] = fabrica(db)
+            return self._derivados[nome]
+
+    def get_indexes(self, db):
+        return self._derivado("indexes", db, Indexes)
+
+    def get_frame(self, db, colecao="atendimentos"):
+        from frames import CollectionFrame
+        return self._derivado(f"frame:{colecao}", db, lambda db: CollectionFrame(db, colecao))
+
+    # Atendimento pelo idAtendimento (mapa de posições do banco em cache); None se não existir
+    def find_atendimento(self, db, id_atendimento):
+        with self._lock:
+            posicoes = self._cache["posicoes"] if self._cache["db"] is db else None
+        try:
+            return db["atendimentos"][_find(db, "atendimentos", id_atendimento, posicoes)]
+        except (KeyError, IndexError):
+            return None
+
+    def get_search(self, db, colecao="atendimentos"):
+        from search import SearchIndex
+        return self._derivado(f"search:{colecao}", db, lambda db: SearchIndex(db, colecao))
+
+    def get_aggregates(self, db):
+        return self._derivado("aggregates", db, Aggregates)
+
+    def get_archive(self):
+        from archive import Archive
+        if self._arquivo is None:
+            self._arquivo = Archive(self.path)
+        return self._arquivo
+
+    # Move para o arquivo os atendimentos encerrados (Lançados e numa das etapas finais, por padrão a
+    # última cadastrada) com idData anterior a antes_mes (AAAA-MM). O arquivo é gravado antes de o banco
+    # ativo ser regravado sem eles: uma queda no meio deixa os registros nos dois lugares, e repetir o
+    # arquivamento os descarta do banco sem duplicá-los no arquivo. Retorna quantos saíram do banco
+    def archive_atendimentos(self, antes_mes, etapas_finais=None):
+        from archive import month_of
+        with span("storage.archive"), self._write_lock():
+            db = self._current()
+            if etapas_finais is None:
+                etapas_finais = [db["etapas"][-1]["id_etapa"]] if db["etapas"] else []
+            saem, ficam = [], []
+            for atendimento in db["atendimentos"]:
+                encerrado = atendimento.get("idChecagem") == "Lançado" and atendimento.get("idEtapa") in etapas_finais
+                (saem if encerrado and month_of(atendimento) < antes_mes else ficam).append(atendimento)
+            if saem:
+                self.get_archive().add(saem)
+                self._save(dict(db, atendimentos=ficam))
+            return len(saem)
+
+    def data_version(self):
+        return self._cache["versao"]
+
+    def cache_stats(self):
+        return {"hits": self._cache["hits"], "misses": self._cache["misses"], "versao": self._cache["versao"]}
+
+    def lock_stats(self):
+        return dict(self._espera)
+
+    # Banco em cache conferido com o disco (outro processo pode ter gravado); chamado com o lock exclusivo
+    def _current(self):
+        assinatura = self._assinatura()
+        if self._cache["db"] is None or self._cache["assinatura"] != assinatura:
+            return self._reload(assinatura)
+        return self._cache["db"]
+
+    # Gravação: com o lock exclusivo, garante que o cache reflete o disco (outro processo pode ter
+    # gravado), confere as versões esperadas, aplica os lançamentos ao banco em cache e os grava
+    # de uma vez; se algo falhar no meio do lote, o cache é descartado e relido do disco
+    def _write(self, entradas, versoes_esperadas=None):
+        with span("storage.write"), self._write_lock():
+            db = self._current()
+            anteriores = []
+            try:
+                for i, entrada in enumerate(entradas):
+                    colecao = entrada["colecao"]
+                    anterior = None
+                    if entrada["op"] != "insert":
+                        anterior = db[colecao][_find(db, colecao, entrada["chave"], self._cache["posicoes"])]
+                    if colecao == "atendimentos":
+                        versao_atual = (anterior.get("versao") or 0) if anterior else 0
+                        versao_esperada = versoes_esperadas[i] if versoes_esperadas else None
+                        if versao_esperada is not None and versao_atual != versao_esperada:
+                            raise VersionConflict(entrada.get("chave"))
+                        if entrada["op"] != "delete":
+                            registro = entrada["registro"]
+                            registro["idAtendimento"] = anterior["idAtendimento"] if anterior else registro.get("idAtendimento") or new_id()
+                            registro["versao"] = versao_atual + 1
+                    anteriores.append(anterior)
+                    pos = _apply(db, entrada, self._cache["posicoes"])
+                    if entrada["op"] == "delete":
+                        # As posições seguintes mudaram: os derivados indexados pela posição (tabelas
+                        # colunares, busca) e os índices são remontados no próximo uso; as estatísticas
+                        # seguem pela variação, como nas demais gravações
+                        self._derivados = {nome: derivado for nome, derivado in self._derivados.items() if nome == "aggregates"}
+                    for derivado in self._derivados.values():
+                        derivado.apply(db, entrada, anterior, pos)
+                depois = self._persist(entradas, anteriores)
+            except BaseException:
+                self._cache["assinatura"] = None
+                raise
+            self._cache["assinatura"] = self._assinatura()
+            self._cache["versao"] += 1
+        if depois:
+            depois()
+
+    # Gravação de um único registro: O(registro) em vez de O(banco). As gravações sempre se aplicam
+    # ao banco em cache (o retornado por load_database)
+    def insert_record(self, db, colecao, registro):
+        self._write([{"op": "insert", "colecao": colecao, "registro": registro}])
+
+    # Inclusão em lote: todos os registros numa única gravação (uma escrita no journal, uma transação no SQLite)
+    def insert_many(self, db, colecao, registros):
+        self._write([{"op": "insert", "colecao": colecao, "registro": registro} for registro in registros])
+
+    # Atendimentos são alterados pelo idAtendimento; com versao_esperada, a alteração falha
+    # com VersionConflict se o registro mudou desde a leitura
+    def update_record(self, db, colecao, chave, registro, versao_esperada=None):
+        self._write([{"op": "update", "colecao": colecao, "chave": chave, "registro": registro}], [versao_esperada])
+
+    # Alteração em lote numa única gravação; alteracoes é [(chave, registro, versao_esperada)] e um
+    # VersionConflict em qualquer registro descarta o lote inteiro
+    def update_many(self, db, colecao, alteracoes):
+        self._write(
+            [{"op": "update", "colecao": colecao, "chave": chave, "registro": registro} for chave, registro, _ in alteracoes],
+            [versao_esperada for _, _, versao_esperada in alteracoes]
+        )
+
+    # Exclusão pela chave (atendimentos pelo idAtendimento, com a mesma conferência de versão da alteração)
+    def delete_record(self, db, colecao, chave, versao_esperada=None):
+        self._write([{"op": "delete", "colecao": colecao, "chave": chave}], [versao_esperada])
+
+    def _set_cache(self, db, agregados=None):
+        pack_database(db)
+        self._cache["posicoes"] = assign_ids(db)
+        self._cache["db"] = db
+        self._derivados = {"aggregates": agregados} if agregados is not None else {}
+        self._cache["assinatura"] = self._assinatura()
+        self._cache["versao"] += 1
+
+    # Página da listagem ordenada (ordenar_por em frames.ORDENACOES ou None para a ordem de cadastro);
+    # só as linhas da página são materializadas. Retorna (tabela, total de registros filtrados)
+    def page_atendimentos(self, status=None, consultor=None, etapa=None,
+                          ordenar_por=None, crescente=True, pagina=1, tamanho=50):
+        from frames import attach_etapas, filter_mask, paginate
+        db = self.load_database()
+        atendimentos = self.get_frame(db)
+        frame = atendimentos.frame()
+        tabela, total = paginate(frame, atendimentos.order(ordenar_por), filter_mask(frame, status, consultor, etapa),
+                                 pagina, tamanho, crescente)
+        return attach_etapas(tabela, db["etapas"]), total
+
+    # Busca textual: os atendimentos mais relevantes para a consulta que passam nos filtros.
+    # Retorna (tabela na ordem de relevância, total de resultados)
+    def search_atendimentos(self, consulta, status=None, consultor=None, etapa=None, limite=50):
+        from frames import attach_etapas, filter_mask
+        db = self.load_database()
+        posicoes = self.get_search(db).search(consulta)
+        resultado = self.get_frame(db).frame().loc[posicoes]
+        resultado = resultado[filter_mask(resultado, status, consultor, etapa)]
+        return attach_etapas(resultado.head(limite), db["etapas"]), len(resultado)
+
+    def search_propostas(self, consulta, limite=50):
+        db = self.load_database()
+        posicoes = self.get_search(db, "propostas").search(consulta)
+        return self.get_frame(db, "propostas").frame().loc[posicoes[:limite]], len(posicoes)
+
+    def page_propostas(self, ordenar_por=None, crescente=True, pagina=1, tamanho=50):
+        import pandas as pd
+        from frames import paginate
+        propostas = self.get_frame(self.load_database(), "propostas")
+        frame = propostas.frame()
+        return paginate(frame, propostas.order(ordenar_por), pd.Series(True, index=frame.index),
+                        pagina, tamanho, crescente)
+
+# Descarta o final de uma gravação interrompida (tudo depois do último "\n"), para que o próximo
+# lançamento comece numa linha própria; chamado com o lock exclusivo
+def _discard_torn_tail(f):
+    tamanho = f.seek(0, os.SEEK_END)
+    if tamanho == 0:
+        return
+    f.seek(tamanho - 1)
+    if f.read(1) == b"\n":
+        return
+    f.seek(0)
+    f.truncate(f.read().rfind(b"\n") + 1)
+
+# Backend JSON: snapshot em database.json + journal append-only com compactação em segundo plano
+class JsonStorage(Storage):
+    def __init__(self, path):
+        super().__init__(path)
+        self._seq = 0
+        self._compactando = False
+
+    def journal_file(self):
+        return self.path + ".journal"
+
+    def _assinatura(self):
+        return (_stat(self.path), _stat(self.journal_file()))
+
+    # Snapshot com a sequência do último lançamento do journal já aplicado e as estatísticas
+    # correspondentes (None em snapshots gravados antes delas)
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            db = default_database()
+            return db, 0, Aggregates(db)
+        with open(self.path, "rb") as f:
+            conteudo = f.read()
+        record_bytes("storage.read", lidos=len(conteudo))
+        with span("json.parse"):
+            data = json.loads(conteudo)
+        meta = data.pop("_meta", {})
+        agregados = Aggregates(estado=meta["agregados"]) if "agregados" in meta else None
+        return data, meta.get("seq", 0), agregados
+
+    def _write_snapshot(self, data, seq, agregados):
+        meta = {"seq": seq, "agregados": agregados.state()}
+        with span("json.dump"):
+            atomic_write(self.path, lambda f: dump_json(dict(data, _meta=meta), f))
+        record_bytes("json.dump", gravados=os.path.getsize(self.path))
+
+    # Lê os lançamentos do journal. Cada lançamento termina em "\n": um final sem ele é uma gravação
+    # interrompida por queda e é ignorado (a próxima gravação o descarta); uma linha completa ilegível
+    # é corrupção, e não fim do journal
+    def _read_journal(self, limite=None):
+        entradas = []
+        if not os.path.exists(self.journal_file()):
+            return entradas
+        with open(self.journal_file(), "rb") as f:
+            conteudo = f.read(limite if limite is not None else -1)
+        record_bytes("storage.read", lidos=len(conteudo))
+        linhas = conteudo.split(b"\n")[:-1]
+        for numero, linha in enumerate(linhas, 1):
+            try:
+                entradas.append(json.loads(linha))
+            except ValueError:
+                raise ValueError(f"Journal corrompido: {self.journal_file()}, linha {numero}") from None
+        return entradas
+
+    # Reaplica os lançamentos posteriores ao snapshot, atualizando também as estatísticas gravadas nele
+    def _replay(self, db, seq, entradas, agregados=None):
+        posicoes = assign_ids(db)
+        for entrada in entradas:
+            if entrada["seq"] > seq:
+                for lancamento in entrada["entradas"] if entrada["op"] == "batch" else [entrada]:
+                    anterior = None
+                    if agregados is not None and lancamento["op"] != "insert":
+                        anterior = db[lancamento["colecao"]][_find(db, lancamento["colecao"], lancamento["chave"], posicoes)]
+                    pos = _apply(db, lancamento, posicoes)
+                    if agregados is not None:
+                        agregados.apply(db, lancamento, anterior, pos)
+                seq = entrada["seq"]
+        return seq
+
+    def _read(self):
+        db, seq, agregados = self._read_snapshot()
+        self._seq = self._replay(db, seq, self._read_journal(), agregados)
+        if agregados is not None:
+            self._derivados_lidos = {"aggregates": agregados}
+        return db
+
+    # Um lote vira uma única linha do journal: uma gravação interrompida não deixa o lote pela metade
+    def _persist(self, entradas, anteriores):
+        self._seq += 1
+        if len(entradas) == 1:
+            linha = dict(entradas[0], seq=self._seq)
+        else:
+            linha = {"op": "batch", "entradas": entradas, "seq": self._seq}
+        dados = (json.dumps(linha, ensure_ascii=False, default=json_default) + "\n").encode('utf-8')
+        with span("storage.persist"), open(self.journal_file(), "a+b") as f:
+            _discard_torn_tail(f)
+            f.write(dados)
+            f.flush()
+            os.fsync(f.fileno())
+            tamanho = f.tell()
+        record_bytes("storage.persist", gravados=len(dados))
+        if tamanho > COMPACT_THRESHOLD and not self._compactando:
+            self._compactando = True
+            return lambda: threading.Thread(target=self.compact_database, daemon=True).start()
+
+    # Regrava o banco inteiro (migrações, restaurações) e descarta o journal
+    def save_database(self, data):
+        with span("storage.save_database"), self._write_lock():
+            self._save(data)
+
+    def _save(self, data):
+        assign_ids(data)
+        agregados = Aggregates(data)
+        self._write_snapshot(data, self._seq, agregados)
+        atomic_write(self.journal_file(), lambda f: None)
+        self._set_cache(data, agregados)
+
+    # Recalcula as estatísticas do zero, percorrendo todo o banco (e incorpora o journal ao snapshot)
+    def rebuild_aggregates(self):
+        with self._write_lock():
+            self._save(self._current())
+
+    # Compactação: incorpora o journal ao snapshot sem bloquear as gravações enquanto serializa
+    def compact_database(self):
+        with span("storage.compact"):
+            self._compact()
+
+    def _compact(self):
+        try:
+            with self._lock, self._file_lock(exclusivo=False):
+                if not os.path.exists(self.journal_file()):
+                    return
+                limite = os.path.getsize(self.journal_file())
+                snapshot = _stat(self.path)
+            db, seq, agregados = self._read_snapshot()
+            seq = self._replay(db, seq, self._read_journal(limite), agregados)
+            normalize_database(db)
+            if agregados is None:
+                agregados = Aggregates(db)
+            with self._write_lock():
+                # Outro processo compactou enquanto este serializava
+                if _stat(self.path) != snapshot:
+                    return
+                em_dia = self._cache["assinatura"] == self._assinatura()
+                restantes = [e for e in self._read_journal() if e["seq"] > seq]
+                self._write_snapshot(db, seq, agregados)
+                atomic_write(self.journal_file(), lambda f: f.writelines(
+                    json.dumps(entrada, ensure_ascii=False) + "\n" for entrada in restantes
+                ))
+                # O conteúdo é o mesmo; só a representação em disco mudou
+                if em_dia:
+                    self._cache["assinatura"] = self._assinatura()
+        finally:
+            self._compactando = False
+
+_storages = {}
+
+def get_storage(path=None):
+    path = path or DB_FILE
+    if path not in _storages:
+        if path.endswith(SQLITE_EXTENSIONS):
+            from sqlite_storage import SqliteStorage
+            _storages[path] = SqliteStorage(path)
+        else:
+            _storages[path] = JsonStorage(path)
+    return _storages[path]
+
+# Backend a que pertence o banco em cache db; quem carregou por get_storage(path) com outro
+# arquivo recebe os índices e derivados desse backend, e não os do banco padrão
+def storage_of(db):
+    for backend in list(_storages.values()):
+        if backend._cache["db"] is db:
+            return backend
+    return get_storage()
+
+def load_database():
+    return get_storage().load_database()
+
+def save_database(data):
+    get_storage().save_database(data)
+
+def insert_record(db, colecao, registro):
+    storage_of(db).insert_record(db, colecao, registro)
+
+def insert_many(db, colecao, registros):
+    storage_of(db).insert_many(db, colecao, registros)
+
+def update_record(db, colecao, chave, registro, versao_esperada=None):
+    storage_of(db).update_record(db, colecao, chave, registro, versao_esperada)
+
+def update_many(db, colecao, alteracoes):
+    storage_of(db).update_many(db, colecao, alteracoes)
+
+def delete_record(db, colecao, chave, versao_esperada=None):
+    storage_of(db).delete_record(db, colecao, chave, versao_esperada)
+
+def get_indexes(db):
+    return storage_of(db).get_indexes(db)
+
+def get_frame(db, colecao="atendimentos"):
+    return storage_of(db).get_frame(db, colecao)
+
+def page_atendimentos(status=None, consultor=None, etapa=None, ordenar_por=None, crescente=True, pagina=1, tamanho=50):
+    return get_storage().page_atendimentos(status, consultor, etapa, ordenar_por, crescente, pagina, tamanho)
+
+def page_propostas(ordenar_por=None, crescente=True, pagina=1, tamanho=50):
+    return get_storage().page_propostas(ordenar_por, crescente, pagina, tamanho)
+
+def find_atendimento(db, id_atendimento):
+    return storage_of(db).find_atendimento(db, id_atendimento)
+
+def get_search(db, colecao="atendimentos"):
+    return storage_of(db).get_search(db, colecao)
+
+def search_atendimentos(consulta, status=None, consultor=None, etapa=None, limite=50):
+    return get_storage().search_atendimentos(consulta, status, consultor, etapa, limite)
+
+def search_propostas(consulta, limite=50):
+    return get_storage().search_propostas(consulta, limite)
+
+def get_aggregates(db):
+    return storage_of(db).get_aggregates(db)
+
+def rebuild_aggregates():
+    get_storage().rebuild_aggregates()
+
+def get_archive():
+    return get_storage().get_archive()
+
+def archive_atendimentos(antes_mes, etapas_finais=None):
+    return get_storage().archive_atendimentos(antes_mes, etapas_finais)
+
+def data_version():
+    return get_storage().data_version()
+
+def cache_stats():
+    return get_storage().cache_stats()
+
+def lock_stats():
+    return get_storage().lock_stats()
@@ -0,0 +1,72 @@
+import pytest
+
+from storage import JsonStorage
+
+def _consultores(path):
+    return [c["id_consultores"] for c in JsonStorage(path).load_database()["consultores"]]
+
+def _insert(path, nome):
+    backend = JsonStorage(path)
+    backend.insert_record(backend.load_database(), "consultores", {"id_consultores": nome, "id_NIF": None})
+    return backend
+
+# Queda no meio de uma gravação: a linha incompleta é descartada e as gravações seguintes sobrevivem
+# a um novo processo e à compactação
+def test_torn_journal_tail(tmp_path):
+    path = str(tmp_path / "database.json")
+    _insert(path, "A")
+    with open(path + ".journal", "ab") as f:
+        f.write(b'{"op": "insert", "colecao": "consultores", "registro": {"id_consu')
+    assert _consultores(path) == ["A"]
+
+    backend = _insert(path, "B")
+    backend.insert_record(backend.load_database(), "consultores", {"id_consultores": "C", "id_NIF": None})
+    assert _consultores(path) == ["A", "B", "C"]
+
+    backend.compact_database()
+    assert _consultores(path) == ["A", "B", "C"]
+
+# Uma linha completa ilegível no meio do journal não é tratada como fim do journal
+def test_corrupted_journal_line(tmp_path):
+    path = str(tmp_path / "database.json")
+    _insert(path, "A")
+    with open(path + ".journal", "rb") as f:
+        lancamento = f.read()
+    with open(path + ".journal", "ab") as f:
+        f.write(b"lixo\n" + lancamento.replace(b'"seq": 1', b'"seq": 2'))
+    with pytest.raises(ValueError, match="Journal corrompido"):
+        JsonStorage(path).load_database()
+
+# Exclusão: as posições seguintes descem, os derivados são remontados e as estatísticas acompanham,
+# também depois de reler o disco (journal no JSON, tabelas no SQLite)
+@pytest.mark.parametrize("arquivo", ["database.json", "database.db"])
+def test_delete_record(tmp_path, arquivo):
+    from aggregates import Aggregates
+    from storage import get_storage
+    path = str(tmp_path / arquivo)
+    backend = get_storage(path)
+    db = backend.load_database()
+    backend.insert_record(db, "propostas", {"idNumPropostas": "P1", "idRazaoSocial": "Padaria", "idCNPJ": "1",
+                                            "idProduto": "X", "idHorasContratadas": 10, "idData": "2024-01-01"})
+    for nome in ("Ana", "Bia", "Caio"):
+        backend.insert_record(db, "atendimentos", {"idChecagem": "Lançado", "idNumPropostas": "P1",
+                                                   "idRazaoSocial": nome, "idData": "2024-01-02"})
+    ids = [atendimento["idAtendimento"] for atendimento in db["atendimentos"]]
+    backend.get_search(db).search("Caio")
+    backend.get_frame(db).frame()
+
+    backend.delete_record(db, "atendimentos", ids[1], versao_esperada=1)
+    assert [a["idRazaoSocial"] for a in db["atendimentos"]] == ["Ana", "Caio"]
+    assert backend.find_atendimento(db, ids[2])["idRazaoSocial"] == "Caio"
+    assert backend.find_atendimento(db, ids[1]) is None
+    assert [db["atendimentos"][pos]["idRazaoSocial"] for pos in backend.get_search(db).search("Caio")] == ["Caio"]
+    assert list(backend.get_frame(db).frame()["idRazaoSocial"]) == ["Ana", "Caio"]
+    assert backend.get_aggregates(db).state() == Aggregates(db).state()
+
+    backend.delete_record(db, "propostas", "P1")
+    backend.compact_database()
+    relido = type(backend)(path)
+    banco = relido.load_database()
+    assert [a["idRazaoSocial"] for a in banco["atendimentos"]] == ["Ana", "Caio"]
+    assert banco["propostas"] == []
+    assert relido.get_aggregates(banco).state() == Aggregates(banco).state()
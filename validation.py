@@ -0,0 +1,128 @@
+from datetime import date, datetime
+
+from storage import CAMPOS
+
+# Validação dos registros, compartilhada pela importação em lote, pelos formulários do app.py e pela API.
+# Cada função retorna a lista de erros (vazia quando o registro é válido)
+
+STATUS = ["Não Lançado", "Lançado"]
+
+CAMPOS_OBRIGATORIOS = {
+    "propostas": ["idNumPropostas", "idRazaoSocial", "idCNPJ", "idProduto"],
+    "consultores": ["id_consultores"],
+    "etapas": ["id_etapa", "descricao"],
+    "atendimentos": ["idChecagem", "idNumPropostas", "idConsultor", "idEtapa", "idData"]
+}
+
+ROTULOS = {
+    "idNumPropostas": "Nº Proposta",
+    "idRazaoSocial": "Razão Social",
+    "idCNPJ": "CNPJ",
+    "idProduto": "Produto",
+    "id_consultores": "Nome do Consultor",
+    "id_etapa": "Código da Etapa",
+    "descricao": "Descrição da Etapa",
+    "idChecagem": "Status",
+    "idConsultor": "Consultor",
+    "idEtapa": "Etapa",
+    "idData": "Data Atendimento"
+}
+
+# Valor gravado nos campos não informados, como fazem o formulário e a importação (importer.map_record):
+# texto vazio, exceto nos campos listados aqui
+PADROES = {
+    "atendimentos": {"idChecagem": "Não Lançado", "idObservacao": None, "idHoraAtend": None, "idData": None, "idDataVisita": None},
+    "propostas": {"idHorasContratadas": 0, "idData": None},
+    "consultores": {"id_NIF": None},
+    "etapas": {}
+}
+
+# Completa o registro com todos os campos da coleção (as telas leem atendimento["campo"] diretamente);
+# idAtendimento e versao ficam a cargo do storage
+def complete_record(colecao, registro):
+    padroes = PADROES[colecao]
+    for campo in CAMPOS[colecao]:
+        if campo not in registro and campo not in ("idAtendimento", "versao"):
+            registro[campo] = padroes.get(campo, "")
+    return registro
+
+# Converte datas de planilhas (date/datetime, AAAA-MM-DD ou DD/MM/AAAA) para AAAA-MM-DD; None se inválida
+def parse_date(valor):
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if not valor:
+        return None
+    texto = str(valor).strip().split("T")[0].split(" ")[0]
+    for formato in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(texto, formato).date().isoformat()
+        except ValueError:
+            pass
+    return None
+
+def _required(colecao, registro):
+    return [
+        f"{ROTULOS.get(campo, campo)} é obrigatório"
+        for campo in CAMPOS_OBRIGATORIOS[colecao]
+        if registro.get(campo) in (None, "")
+    ]
+
+# novas_chaves: chaves já aceitas no mesmo lote, para detectar repetições dentro do arquivo;
+# atual: chave do registro que está sendo alterado (pode ser mantida)
+def _duplicate(chave, existentes, novas_chaves, atual):
+    return chave and chave != atual and (chave in existentes or chave in novas_chaves)
+
+def validate_proposta(registro, indices, novas_chaves=(), atual=None):
+    erros = _required("propostas", registro)
+    chave = registro.get("idNumPropostas")
+    if _duplicate(chave, indices.propostas, novas_chaves, atual):
+        erros.append(f"Proposta {chave} já cadastrada")
+    horas = registro.get("idHorasContratadas")
+    # bool é subclasse de int: true/false de um JSON não são horas
+    if horas is not None and (not isinstance(horas, int) or isinstance(horas, bool) or horas < 0):
+        erros.append("Horas Contratadas deve ser um número inteiro não negativo")
+    if registro.get("idData") is not None and parse_date(registro["idData"]) is None:
+        erros.append("Data da Proposta inválida")
+    return erros
+
+def validate_consultor(registro, indices, novas_chaves=(), atual=None):
+    erros = _required("consultores", registro)
+    chave = registro.get("id_consultores")
+    if _duplicate(chave, indices.consultores, novas_chaves, atual):
+        erros.append(f"Consultor {chave} já cadastrado")
+    return erros
+
+def validate_etapa(registro, indices, novas_chaves=(), atual=None):
+    erros = _required("etapas", registro)
+    chave = registro.get("id_etapa")
+    if _duplicate(chave, indices.etapas, novas_chaves, atual):
+        erros.append("Já existe uma etapa com este código!")
+    return erros
+
+# novas_propostas: propostas válidas do mesmo lote, que podem ser referenciadas pelos atendimentos
+def validate_atendimento(registro, indices, novas_propostas=(), atual=None):
+    erros = _required("atendimentos", registro)
+    if registro.get("idChecagem") and registro["idChecagem"] not in STATUS:
+        erros.append(f"Status deve ser {' ou '.join(STATUS)}")
+    proposta = registro.get("idNumPropostas")
+    if proposta and proposta not in indices.propostas and proposta not in novas_propostas:
+        erros.append(f"Proposta {proposta} não cadastrada")
+    consultor = registro.get("idConsultor")
+    if consultor and consultor not in indices.consultores:
+        erros.append(f"Consultor {consultor} não cadastrado")
+    etapa = registro.get("idEtapa")
+    if etapa and etapa not in indices.etapas:
+        erros.append(f"Etapa {etapa} não cadastrada")
+    for campo, rotulo in (("idData", "Data Atendimento"), ("idDataVisita", "Data Visita")):
+        if registro.get(campo) and parse_date(registro[campo]) is None:
+            erros.append(f"{rotulo} inválida")
+    return erros
+
+VALIDADORES = {
+    "propostas": validate_proposta,
+    "consultores": validate_consultor,
+    "etapas": validate_etapa,
+    "atendimentos": validate_atendimento
+}